@@ -1,65 +1,93 @@
-from flask import Flask, render_template, request, send_from_directory, jsonify, url_for
-from werkzeug.utils import secure_filename
+from flask import Flask, Response, render_template, request, send_file, jsonify, url_for, stream_with_context
 import os
 import re
-import io
+import json
+import shutil
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import pymupdf  # PyMuPDF
-import mysql.connector
-import pytesseract
-from PIL import Image, ImageEnhance
+from PIL import Image
+import extraction_cache
+import fund_names
+import audit_index
+import audit_state
+import blob_store
+import bank_profiles
+import jobs
+import ocr_engine
+import telemetry
+import upload_stream
+from main import value_to_cents
 
 app = Flask(__name__)
 app.secret_key = 'sua_chave_secreta'
 
-UPLOAD_FOLDER = 'uploads'
+telemetry.configure_logging()
+log = logging.getLogger('corretor.app')
+
+# Os uploads maiores que UPLOAD_SPILL_BYTES e as apurações marcadas ficam no armazenamento por
+# conteúdo (blob_store.py), com remoção de fundo por idade e tamanho; o download de cada auditoria
+# é o nome '<id>/<arquivo>' ligado ao hash. Em OUTPUT_FOLDER ficam só os perfis cProfile.
 OUTPUT_FOLDER = 'output'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
-
-
-# --- DB CONNECTION ---
-def get_db_connection():
-    return mysql.connector.connect(
-        user='augusto',
-        password='somma13',
-        host='smiconsult.com.br',
-        database='smiconsult'
-    )
-
-
-def get_fund_name_from_db(cnpj_raw):
-    if not cnpj_raw: return None
-    clean_cnpj = re.sub(r'[^\d]', '', cnpj_raw)
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        query = f"""
-            SELECT nome_fundo FROM gerador_fundos
-            WHERE (cnpj_fundo LIKE '%{cnpj_raw}%' OR cnpj_fundo LIKE '%{clean_cnpj}%')
-            ORDER BY periodo_fundo DESC LIMIT 1
-        """
-        cursor.execute(query)
-        result = cursor.fetchone()
-        conn.close()
-        if result: return result[0]
-    except Exception as e:
-        print(f"   [DB ERRO] Falha ao buscar nome para CNPJ {cnpj_raw}: {e}")
-    return None
+blob_store.start_eviction()
+
+# Número de processos usados para extrair os extratos em paralelo (1 = serial, numa thread de fundo)
+EXTRACTION_WORKERS = int(os.environ.get('EXTRACTION_WORKERS', os.cpu_count() or 1))
+app.config['EXTRACTION_WORKERS'] = EXTRACTION_WORKERS
+
+# OCR paralelo por página: threads disparando o tesseract e limite de páginas renderizadas em memória
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', 4))
+OCR_MAX_PAGES_IN_MEMORY = int(os.environ.get('OCR_MAX_PAGES_IN_MEMORY', OCR_WORKERS * 2))
+# Cada tesseract já roda em paralelo com os outros; evita que o OpenMP dele dispute os mesmos núcleos
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+# Resolução da renderização para OCR (144 dpi = a antiga Matrix(2, 2)); pode ser ajustada por banco.
+# A primeira página usa OCR_DPI; as demais usam o valor do banco detectado nela.
+OCR_DPI = int(os.environ.get('OCR_DPI', 144))
+OCR_DPI_BY_BANK = {
+    '104': OCR_DPI,  # Caixa
+    '341': OCR_DPI,  # Itaú
+    '1': OCR_DPI,    # Banco do Brasil
+    '237': OCR_DPI,  # Bradesco
+    '41': OCR_DPI,   # Safra
+    '11': OCR_DPI,
+}
+# Abaixo desta confiança média (0-100) o OCR de uma página refaz a detecção de orientação (OSD)
+OCR_MIN_CONFIDENCE = float(os.environ.get('OCR_MIN_CONFIDENCE', 60))
+
+# Permite pedir um perfil cProfile de uma requisição (cabeçalho X-Profile: 1 ou ?profile=1)
+app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED') == '1'
+PROFILE_FOLDER = os.path.join(OUTPUT_FOLDER, 'profiles')
+
+# Diferença máxima (centavos) aceita ao bater um valor do extrato com a apuração (0 = exato)
+VALUE_MATCH_TOLERANCE_CENTS = int(os.environ.get('VALUE_MATCH_TOLERANCE_CENTS', 0))
+
+# Similaridade mínima (0-1, Dice sobre trigramas ponderados) para aceitar um nome de fundo na apuração
+FUND_NAME_SIMILARITY = float(os.environ.get('FUND_NAME_SIMILARITY', 0.7))
+# Se o segundo colocado fica a menos disso do escolhido, o log avisa que a escolha foi apertada
+FUND_NAME_MARGIN = 0.1
+
+# Incrementar sempre que a lógica de extração mudar: invalida os resultados já guardados no cache
+EXTRACTOR_VERSION = '6'
+
+# Reauditoria incremental: com a mesma apuração de uma rodada anterior, só os extratos novos ou
+# alterados são extraídos e marcados, sobre uma cópia da saída anterior (audit_state.py)
+INCREMENTAL_AUDIT = os.environ.get('INCREMENTAL_AUDIT', '1') == '1'
+# Incrementar sempre que a forma de marcar mudar (ex.: a pontuação dos nomes de fundo)
+MARKING_VERSION = '2'
+# Tudo que muda as marcações de um extrato além do conteúdo dele; se mudar, a rodada marca do zero
+AUDIT_STATE_VERSION = f"{EXTRACTOR_VERSION}:{MARKING_VERSION}:{VALUE_MATCH_TOLERANCE_CENTS}:{FUND_NAME_SIMILARITY}"
 
 
 # --- HELPERS ---
 def detect_text_orientation(image):
-    try:
-        custom_config = r'--psm 0'
-        result = pytesseract.image_to_osd(image, config=custom_config)
-        for line in result.split('\n'):
-            if 'Rotate' in line: return int(line.split(':')[1].strip())
-    except:
-        return 0
-    return 0
+    with telemetry.stage('osd'):
+        return ocr_engine.detect_orientation(image)
 
 
 def rotate_image(image, angle):
@@ -67,13 +95,140 @@ def rotate_image(image, angle):
 
 
 def detect_bank_type(text):
-    text_upper = text.upper()
-    if "ITAÚ" in text_upper or "ITAU" in text_upper: return '341'
-    if "CAIXA" in text_upper or "FUNDO DE INVESTIMENTO" in text_upper: return '104'
-    if "BANCO DO BRASIL" in text_upper or "BB" in text_upper: return '1'
-    if "BRADESCO" in text_upper: return '237'
-    if "SAFRA" in text_upper: return '41'
-    return '11'
+    profile = bank_profiles.detect(text, 'app')
+    return profile['code'] if profile else bank_profiles.DEFAULT_CODE
+
+
+def _contrast_lut(gray, factor):
+    # Mesma conta do ImageEnhance.Contrast: afasta cada tom da média da imagem pelo fator
+    histogram = gray.histogram()
+    pixels = sum(histogram) or 1
+    mean = int(sum(i * count for i, count in enumerate(histogram)) / pixels + 0.5)
+    return [max(0, min(255, int(mean + factor * (i - mean)))) for i in range(256)]
+
+
+def render_page_for_ocr(page, dpi=None):
+    """
+    Renderiza a página já em tons de cinza e usa o buffer do pixmap direto como imagem PIL,
+    sem codificar/decodificar PNG. O contraste é aplicado numa única passada por tabela (LUT).
+    """
+    with telemetry.stage('render'):
+        pix = page.get_pixmap(dpi=dpi or OCR_DPI, colorspace=pymupdf.csGRAY, alpha=False)
+        gray = Image.frombuffer('L', (pix.width, pix.height), pix.samples_mv, 'raw', 'L', pix.stride, 1)
+        img = gray.point(_contrast_lut(gray, 2))
+        # A imagem compartilhada precisa sair antes do pixmap que é dono do buffer
+        del gray
+    return img
+
+
+def ocr_image(img, rotation=0):
+    """Reconhece a imagem (girada de `rotation` graus). Retorna (texto, confiança média 0-100)."""
+    if rotation: img = rotate_image(img, -rotation)
+    with telemetry.stage('ocr'):
+        return ocr_engine.recognize(img)
+
+
+def recognize_page(img, rotation):
+    """
+    OCR com a orientação já conhecida do documento. O OSD (uma chamada extra ao tesseract)
+    só roda quando a confiança vem abaixo de OCR_MIN_CONFIDENCE e sugere outro giro.
+    Retorna (texto, giro usado).
+    """
+    text, confidence = ocr_image(img, rotation)
+    if confidence >= OCR_MIN_CONFIDENCE: return text, rotation
+
+    detected = detect_text_orientation(img)
+    if detected != rotation:
+        retry_text, retry_confidence = ocr_image(img, detected)
+        if retry_confidence > confidence: return retry_text, detected
+    return text, rotation
+
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+
+def get_ocr_pool():
+    # Pool persistente no processo: cada thread mantém o seu motor de OCR carregado entre documentos
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ThreadPoolExecutor(max_workers=max(1, OCR_WORKERS), thread_name_prefix='ocr')
+        return _ocr_pool
+
+
+def iter_page_texts(doc):
+    """
+    Gera (número da página, texto) na ordem do documento, uma página por vez.
+    Páginas com camada de texto saem na hora; as que são imagem vão para o OCR, renderizadas em
+    sequência (o pymupdf não é thread-safe) e reconhecidas em paralelo com OCR_WORKERS threads.
+    No máximo OCR_MAX_PAGES_IN_MEMORY imagens (e páginas à espera de uma anterior) ficam vivas.
+    """
+    pool = get_ocr_pool()
+    slots = threading.BoundedSemaphore(max(1, OCR_MAX_PAGES_IN_MEMORY))
+    pending = deque()  # (número da página, texto ou Future do OCR), na ordem do documento
+    rotation = dpi = None
+
+    def recognize(img):
+        try:
+            return recognize_page(img, rotation)[0]
+        finally:
+            slots.release()
+
+    def ready():
+        if not pending: return False
+        head = pending[0][1]
+        return not isinstance(head, Future) or head.done() or len(pending) > OCR_MAX_PAGES_IN_MEMORY
+
+    def pop():
+        page_number, item = pending.popleft()
+        return page_number, item.result() if isinstance(item, Future) else item
+
+    try:
+        for page_number in range(len(doc)):
+            page = doc[page_number]
+            telemetry.incr('pages_total')
+            with telemetry.stage('text_extract'):
+                text = read_text_layer(page)
+            if text is None:
+                telemetry.incr('pages_ocr')
+                if rotation is None:
+                    # A primeira página escaneada define a orientação do documento e, pelo banco, o DPI das demais
+                    log.info("Página sem camada de texto. Ativando OCR...")
+                    text, rotation = pool.submit(contextvars.copy_context().run, recognize_page,
+                                                 render_page_for_ocr(page), 0).result()
+                    if rotation: log.info(f"Orientação do documento: {rotation} graus")
+                    dpi = OCR_DPI_BY_BANK.get(detect_bank_type(text), OCR_DPI)
+                else:
+                    slots.acquire()
+                    try:
+                        img = render_page_for_ocr(page, dpi)
+                    except Exception:
+                        slots.release()
+                        raise
+                    # Cada tarefa leva uma cópia do contexto: id da requisição e coletor de métricas
+                    text = pool.submit(contextvars.copy_context().run, recognize, img)
+                    del img
+            del page
+            pending.append((page_number, text))
+            while ready():
+                yield pop()
+        while pending:
+            yield pop()
+    finally:
+        # Consumidor parou antes do fim: o que ainda não começou nem chega a rodar
+        for _, item in pending:
+            if isinstance(item, Future): item.cancel()
+
+
+def read_text_layer(page):
+    """Texto embutido da página, ou None se ela for só imagem (a rotação original é restaurada)."""
+    original = page.rotation
+    page.set_rotation((original + 90) % 360)
+    text = page.get_text()
+    if text.strip(): return text
+    page.set_rotation(original)
+    return None
 
 
 # --- NOVA LÓGICA: Extrair Conta ---
@@ -86,13 +241,30 @@ def extract_account_hint(filename):
 
 
 # --- EXTRAÇÃO DE DADOS ---
-def extract_advanced_data(pdf_path):
-    filename = os.path.basename(pdf_path)
-    print(f"\n--- Processando: {filename} ---")
+def extract_advanced_data(source, content_hash=None):
+    """Extrai um extrato a partir do caminho ou de (nome, bytes) recebido em memória."""
+    filename = upload_stream.source_name(source)
+    with telemetry.bind(arquivo=filename):
+        return _extract_advanced_data(source, filename, content_hash)
+
+
+def _extract_advanced_data(source, filename, content_hash=None):
+    log.info("Processando extrato")
 
     account_hint = extract_account_hint(filename)
     if account_hint:
-        print(f"   [DICA] Conta identificada no arquivo: {account_hint}")
+        log.info(f"Conta identificada no arquivo: {account_hint}")
+
+    content_hash = content_hash or upload_stream.source_sha256(source)
+    cached = extraction_cache.get(content_hash, EXTRACTOR_VERSION)
+    if cached is not None:
+        # A dica de conta vem do nome do arquivo, não do conteúdo; por isso não fica no cache
+        cached['account_hint'] = account_hint
+        telemetry.incr('cache_hits')
+        log.info(f"Extração reaproveitada do cache ({content_hash[:12]}): "
+                 f"{len(cached['valores'])} valores, banco {cached['banco_detectado']}")
+        return cached
+    telemetry.incr('cache_misses')
 
     extracted_data = {
         'cnpjs': [],
@@ -102,212 +274,579 @@ def extract_advanced_data(pdf_path):
         'banco_detectado': None
     }
 
-    doc = pymupdf.open(pdf_path)
-
-    pg = doc.load_page(0)
-    if len(pg.get_text()) == 0:
-        ocr = True
-        print("   [INFO] PDF é imagem. Ativando OCR...")
-    else:
-        ocr = False
-
-    full_text_accumulated = ""
-
-    for page in doc:
-        text = ""
-        split_text = []
-
-        if ocr:
-            matrix = pymupdf.Matrix(2, 2)
-            pix = page.get_pixmap(matrix=matrix)
-            img = Image.open(io.BytesIO(pix.tobytes()))
-            img = img.convert('L')
-            enhancer = ImageEnhance.Contrast(img)
-            img = enhancer.enhance(2)
-            rot = detect_text_orientation(img)
-            if rot != 0: img = rotate_image(img, -rot)
-            text = pytesseract.image_to_string(img, lang='por', config=r'--oem 3 --psm 6')
-            split_text = text.split()
-        else:
-            page.set_rotation((page.rotation + 90) % 360)
-            raw_text = page.get_text()
-            text = raw_text
-            split_text = raw_text.split()
-
-        full_text_accumulated += text
-
-        if not extracted_data['banco_detectado']:
-            extracted_data['banco_detectado'] = detect_bank_type(text)
-            print(f"   [INFO] Banco Detectado: {extracted_data['banco_detectado']}")
-
-        extrato = extracted_data['banco_detectado']
-
-        # BUSCA CNPJs
-        cnpjs_found = re.findall(r'\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}', text)
-        for c in cnpjs_found: extracted_data['cnpjs'].append(c)
-
-        if extrato == '341':
-            for i in range(len(split_text)):
-                if split_text[i] == 'CNPJ' and (i + 2 < len(split_text)) and split_text[i + 2] == 'Taxa':
-                    extracted_data['cnpjs'].append(split_text[i + 1])
-
-        # --- BUSCA VALORES (ARRASTÃO) ---
-        if extrato in ['1', '11', '104', '237', '41', '341']:
-
-            # 1. Regex Padrão (Isolado)
-            # Captura 1.000,00 isolado
-            raw_values = re.findall(r'(?:\s|^)([1-9]\d{0,2}(?:\.\d{3})*,\d{2})(?:\s|$)', text)
-            extracted_data['valores'].extend(raw_values)
-
-            # 2. Regex Específico CAIXA (Sufixo C/D)
-            # Captura 1.000,00C ou 1.000,00 D
-            # O grupo de captura é apenas o número
-            if extrato == '104':
-                caixa_values = re.findall(r'(?:\s|^)([1-9]\d{0,2}(?:\.\d{3})*,\d{2})(?:\s*[CDcd])(?:\s|$)', text)
-                extracted_data['valores'].extend(caixa_values)
-
-            # 3. Regex por Contexto (Palavras-chave)
-            keywords = r'(?:SALDO|TOTAL|VALOR|BRUTO|LÍQUIDO|ATUAL|FINAL|RESGATADO|APLICADO)'
-            context_values = re.findall(rf'{keywords}.*?([1-9]\d{{0,2}}(?:\.\d{{3}})*,\d{{2}})', text, re.IGNORECASE)
-            extracted_data['valores'].extend(context_values)
-
-    extracted_data['cnpjs'] = list(set(extracted_data['cnpjs']))
-
-    for cnpj in extracted_data['cnpjs']:
-        nome = get_fund_name_from_db(cnpj)
-        if nome:
-            extracted_data['target_names'].append(nome)
-            print(f"   [DB] {cnpj} -> {nome}")
+    with telemetry.stage('pdf_open'):
+        doc = upload_stream.open_pdf(source)
+
+    # Roteamento por página: usa a camada de texto quando existe e faz OCR só das páginas-imagem.
+    # Cada página é processada e descartada antes da próxima; só os resultados ficam.
+    cnpjs = {}
+    clean_vals = {}
+    with doc:
+        for _, text in iter_page_texts(doc):
+            if not extracted_data['banco_detectado']:
+                extracted_data['banco_detectado'] = detect_bank_type(text)
+                log.info(f"Banco detectado: {extracted_data['banco_detectado']}")
+
+            # Padrões do banco (bank_profiles), sobre o texto da página normalizado uma única vez
+            profile = bank_profiles.by_code(extracted_data['banco_detectado'])
+            page_text = bank_profiles.normalize_page(text, 'app')
+            for c in bank_profiles.scan_cnpjs(profile, page_text):
+                cnpjs.setdefault(c)
+            for v in bank_profiles.scan_values(profile, page_text, 'app'):
+                _add_clean_value(clean_vals, v)
+
+    # Os nomes dos fundos são resolvidos depois, em lote para todos os extratos (attach_fund_names)
+    extracted_data['cnpjs'] = list(cnpjs)
+    extracted_data['valores'] = list(clean_vals.values())
+    log.info(f"Encontrados {len(extracted_data['valores'])} valores candidatos")
+
+    extraction_cache.put(content_hash, EXTRACTOR_VERSION,
+                         {k: v for k, v in extracted_data.items() if k != 'account_hint'})
+
+    return extracted_data
+
 
+def _add_clean_value(clean_vals, v):
     # --- LIMPEZA DE VALORES (Remover C, D, R$, Espaços) ---
-    clean_vals = []
-    for v in extracted_data['valores']:
-        if not v: continue
+    # Um valor por quantia em centavos: '1.000,00C' e '1.000,00' contam uma vez só
+    if not v: return
 
-        # Remove letras e símbolos, mantém apenas dígitos, ponto e vírgula
-        # Isso garante que '1.000,00C' vire '1.000,00'
-        v_clean = re.sub(r'[^\d,.]', '', v)
+    # Remove letras e símbolos, mantém apenas dígitos, ponto e vírgula
+    # Isso garante que '1.000,00C' vire '1.000,00'
+    v_clean = re.sub(r'[^\d,.]', '', v)
 
-        try:
-            # Valida se é um número válido > 0
-            check_v = v_clean.replace('.', '').replace(',', '.')
-            if float(check_v) > 0:
-                clean_vals.append(v_clean)
-        except:
-            pass
+    # Valida se é um número válido > 0
+    cents = value_to_cents(v_clean)
+    if cents:
+        clean_vals.setdefault(cents, v_clean)
 
-    extracted_data['valores'] = list(set(clean_vals))
-    print(f"   [VALORES] Encontrados {len(extracted_data['valores'])} candidatos.")
 
-    return extracted_data
+# --- EXTRAÇÃO PARALELA ---
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+
+
+def get_extraction_pool():
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            workers = app.config['EXTRACTION_WORKERS']
+            # Serial: uma thread só, para a extração não rodar dentro da leitura do upload
+            _extraction_pool = (ProcessPoolExecutor(max_workers=workers) if workers > 1 else
+                                ThreadPoolExecutor(max_workers=1, thread_name_prefix='extraction'))
+        return _extraction_pool
+
+
+def _forget_extraction_pool():
+    # Processo criado por fork (ex.: gunicorn --preload) herda o pool do pai sem as threads e os
+    # processos dele: as extrações enviadas a essa cópia nunca terminariam
+    global _extraction_pool, _extraction_pool_lock
+    _extraction_pool = None
+    _extraction_pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_extraction_pool)
+
+
+def _reset_extraction_pool(pool):
+    """
+    Descarta o pool quebrado `pool`. Se outra requisição já o trocou por um novo, o novo fica:
+    derrubá-lo cancelaria as extrações que ela acabou de enfileirar.
+    """
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is not pool: return
+        _extraction_pool.shutdown(wait=False, cancel_futures=True)
+        _extraction_pool = None
+
+
+def _extract_worker(source, content_hash=None):
+    # Roda no processo filho: logs e métricas são coletados e devolvidos ao pai, para que o log
+    # de cada arquivo saia agrupado (com o id da requisição) e as métricas fiquem no /metrics do pai
+    with telemetry.capture() as collected:
+        try:
+            data = extract_advanced_data(source, content_hash)
+        except Exception as e:
+            log.error(f"Falha ao extrair {upload_stream.source_name(source)}: {e}")
+            data = None
+    return data, collected
+
+
+def submit_extraction(source):
+    """
+    Dispara a extração de um extrato no pool limitado por EXTRACTION_WORKERS e retorna
+    (nome, hash do conteúdo, Future). Com EXTRACTION_WORKERS = 1 os extratos são extraídos um
+    por vez numa thread de fundo, sem processos filhos.
+    """
+    name = upload_stream.source_name(source)
+    # O hash sai aqui (e não só no filho) para a reauditoria saber, sem esperar a extração,
+    # quais extratos já foram marcados numa rodada anterior
+    content_hash = upload_stream.source_sha256(source)
+    pool = get_extraction_pool()
+    future = pool.submit(_extract_worker, source, content_hash)
+    future.extraction_pool = pool  # collect_statements recria só o pool de onde veio uma falha
+    return name, content_hash, future
+
+
+def collect_statements(started, on_progress=None):
+    """
+    Aguarda as extrações de submit_extraction. Os resultados voltam na ordem do upload e a falha
+    de um arquivo não interrompe os demais. on_progress(índice, ok) é chamado assim que cada
+    extrato termina, na ordem de conclusão. Cada resultado leva o 'content_hash' do arquivo.
+    """
+    if not started: return []
+
+    outcomes = [None] * len(started)
+    futures = {future: i for i, (_, _, future) in enumerate(started)}
+    broken = set()
+    for future in as_completed(futures):
+        i = futures[future]
+        try:
+            outcomes[i] = future.result()
+        except Exception as e:
+            # Processo filho morreu (ex.: falta de memória); o pool precisa ser recriado
+            broken.add(future.extraction_pool)
+            name = started[i][0]
+            with telemetry.capture() as collected, telemetry.bind(arquivo=name):
+                log.error(f"Falha ao extrair {name}: {e}")
+            outcomes[i] = (None, collected)
+        if on_progress: on_progress(i, outcomes[i][0] is not None)
+    for pool in broken:
+        _reset_extraction_pool(pool)
+
+    dados_audit = []
+    for (_, content_hash, _), (data, collected) in zip(started, outcomes):
+        telemetry.replay(collected)
+        if data:
+            data['content_hash'] = content_hash
+            dados_audit.append(data)
+    return dados_audit
+
+
+def extract_all_statements(sources, on_progress=None):
+    return collect_statements([submit_extraction(s) for s in sources], on_progress=on_progress)
+
+
+def _target_names(cnpjs, names):
+    """Nomes dos fundos de um extrato, sem repetição e na ordem dos CNPJs."""
+    target_names = []
+    for cnpj in cnpjs:
+        nome = names.get(fund_names.normalize_cnpj(cnpj))
+        if nome and nome not in target_names:
+            target_names.append(nome)
+    return target_names
+
+
+def attach_fund_names(dados_audit):
+    """
+    Resolve os CNPJs de todos os extratos em uma única consulta e preenche target_names.
+    'nomes_ok' fica False nos extratos com algum CNPJ que não pôde ser consultado (MySQL fora).
+    """
+    failed = set()
+    with telemetry.stage('db_resolve'):
+        names = fund_names.resolve_fund_names([c for item in dados_audit for c in item['cnpjs']], failed=failed)
+    for item in dados_audit:
+        item['target_names'] = _target_names(item['cnpjs'], names)
+        item['nomes_ok'] = not any(fund_names.normalize_cnpj(c) in failed for c in item['cnpjs'])
+        for cnpj in item['cnpjs']:
+            nome = names.get(fund_names.normalize_cnpj(cnpj))
+            if nome: log.info(f"Fundo resolvido: {cnpj} -> {nome}")
+    return dados_audit
+
+
+def unchanged_statements(statements):
+    """
+    Dos extratos de uma auditoria anterior, os que podem ser reaproveitados: os CNPJs deles
+    resolvem hoje para os mesmos nomes (cache e índice local tornam a consulta barata). Ficam de
+    fora os salvos sem CNPJs ou com a consulta falha e os que não puderam ser consultados agora.
+    """
+    candidates = {key: st for key, st in statements.items() if st['cnpjs'] is not None and st['nomes'] is not None}
+    failed = set()
+    with telemetry.stage('db_resolve'):
+        names = fund_names.resolve_fund_names([c for st in candidates.values() for c in st['cnpjs']], failed=failed)
+    return {key: st for key, st in candidates.items()
+            if not any(fund_names.normalize_cnpj(c) in failed for c in st['cnpjs'])
+            and _target_names(st['cnpjs'], names) == st['nomes']}
 
 
 # --- AUDITORIA INTELIGENTE ---
-def highlight_audit_file(apuracao_path, output_path, extratos_data):
-    print("\n========== INICIANDO MARCAÇÃO CRUZADA ==========")
-    doc = pymupdf.open(apuracao_path)
+def _add_mark(page, rect, color, tag):
+    # O 'subject' guarda a chave do extrato: numa reauditoria as marcações dele são achadas e removidas
+    annot = page.add_highlight_annot(rect)
+    annot.set_colors(stroke=color)
+    if tag: annot.set_info(subject=tag)
+    annot.update()
+
+
+def _highlight_row_values(page, page_index, row_no, valores, tag=None):
+    marks = 0
+    for val, rects in audit_index.find_values_in_row(page_index, row_no, valores):
+        log.info(f"Valor {val} batido")
+        for v_rect in rects:
+            _add_mark(page, v_rect, (0, 1, 0), tag)  # Verde
+            marks += 1
+    return marks
+
+
+def highlight_audit_file(apuracao, output_path, extratos_data):
+    log.info("Iniciando marcação cruzada")
+    with upload_stream.open_pdf(apuracao) as doc:
+        with telemetry.stage('highlight'):
+            total_marks = _highlight_document(doc, extratos_data)
+        with telemetry.stage('pdf_save'):
+            doc.save(output_path)
+    telemetry.incr('highlights', total_marks)
+    return total_marks
+
+
+def update_audit_file(output_path, extratos_data, removed):
+    """
+    Reauditoria sobre `output_path`, uma cópia da saída anterior: tira as marcações dos extratos
+    que saíram ou mudaram (`removed`: {chave: páginas}) e marca só `extratos_data`. Só as páginas
+    afetadas mudam e o PDF é gravado com salvamento incremental (os objetos alterados vão no fim).
+    """
+    log.info(f"Reauditoria sobre a saída anterior: {len(extratos_data)} extratos a marcar, "
+             f"{len(removed)} a desmarcar")
+    if not extratos_data and not removed: return 0
+
+    rewrite_path = None
+    with pymupdf.open(output_path) as doc:
+        with telemetry.stage('highlight'):
+            for key, pages in removed.items():
+                _remove_marks(doc, audit_state.annotation_tag(key), pages)
+            total_marks = _highlight_document(doc, extratos_data)
+        with telemetry.stage('pdf_save'):
+            if doc.can_save_incrementally():
+                doc.saveIncr()
+            else:
+                # PDF reparado na abertura: o pymupdf só grava por inteiro
+                rewrite_path = output_path + '.tmp'
+                doc.save(rewrite_path)
+    if rewrite_path: os.replace(rewrite_path, output_path)
+    telemetry.incr('highlights', total_marks)
+    return total_marks
+
+
+def _remove_marks(doc, tag, pages):
+    for page_no in pages:
+        if page_no >= doc.page_count: continue
+        page = doc[page_no]
+        for xref in [annot.xref for annot in page.annots() if annot.info.get('subject') == tag]:
+            page.delete_annot(page.load_annot(xref))
+
+
+def _highlight_document(doc, extratos_data):
+    """
+    Marca os extratos na apuração e retorna o total de valores batidos. Cada extrato fica com
+    'marcacao' = {'paginas', 'total'}; com 'chave' (run_audit), as anotações levam essa chave.
+    """
+    # Uma única leitura das palavras de cada página; as buscas abaixo são consultas nesse índice
+    index = audit_index.build_document_index(doc)
+    name_index = audit_index.build_name_index(index)
     total_marks = 0
 
     for item in extratos_data:
         targets = item['target_names']
-        valores = item['valores']
+        valores = audit_index.build_value_lookup(item['valores'], VALUE_MATCH_TOLERANCE_CENTS)
         account_hint = item['account_hint']
         banco = item.get('banco_detectado', '?')
+        tag = audit_state.annotation_tag(item['chave']) if item.get('chave') else None
+        item['marcacao'] = {'paginas': [], 'total': 0}
 
         if not targets and not account_hint: continue
 
-        print(f">> Auditando: {targets} (Conta Dica: {account_hint})")
+        log.info(f"Auditando: {targets} (conta dica: {account_hint})")
+        telemetry.incr('values_searched', len(item['valores']))
+
+        # Candidatos pelo nome, ranqueados uma vez no documento todo: {página: [(linha, Rect, similaridade, nome)]}
+        name_hits = {}
+        for target_name in targets:
+            if len(target_name) < 5: continue
+            matches, runner_up = audit_index.find_fund_name(name_index, target_name, FUND_NAME_SIMILARITY)
+            if matches and (len(matches) > 1 or matches[0][3] - runner_up < FUND_NAME_MARGIN):
+                log.warning(f"Nome do fundo ambíguo na apuração: {target_name} (similaridade {matches[0][3]:.2f}, "
+                            f"{len(matches)} linhas empatadas, segunda {runner_up:.2f})")
+            for page_no, row_no, rect, score in matches:
+                name_hits.setdefault(page_no, []).append((row_no, rect, score, target_name))
 
         found_account = False
+        item_marks = 0
+        pages = []
 
-        for page in doc:
+        for page, page_index in zip(doc, index):
+            marked = False
 
             # ESTRATÉGIA 1: CONTA (Esquerda)
             if account_hint and len(account_hint) >= 3:
-                account_instances = page.search_for(account_hint)
-                valid_account_instances = [rect for rect in account_instances if rect.x0 < 200]
+                valid_account_instances = audit_index.find_token_containing(page_index, account_hint, max_x0=200)
 
                 if valid_account_instances:
-                    print(f"   [ALVO] Conta {account_hint} localizada!")
+                    log.info(f"Conta {account_hint} localizada na página {page.number + 1}")
                     found_account = True
-                    for rect in valid_account_instances:
-                        annot = page.add_highlight_annot(rect)
-                        annot.set_colors(stroke=(1, 0.6, 0))
-                        annot.update()
-
-                        search_rect = pymupdf.Rect(0, rect.y0 - 2, page.rect.width, rect.y1 + 2)
-
-                        for val in valores:
-                            val_instances = page.search_for(val, clip=search_rect)
-                            if val_instances:
-                                print(f"      [CONFIRMADO] Valor {val} batido!")
-                                for v_rect in val_instances:
-                                    annot_v = page.add_highlight_annot(v_rect)
-                                    annot_v.set_colors(stroke=(0, 1, 0))  # Verde
-                                    annot_v.update()
-                                    total_marks += 1
+                    for row_no, rect in valid_account_instances:
+                        _add_mark(page, rect, (1, 0.6, 0), tag)
+                        marked = True
+
+                        item_marks += _highlight_row_values(page, page_index, row_no, valores, tag)
 
             # ESTRATÉGIA 2: NOME DO FUNDO (Fallback)
             if not found_account:
-                for target_name in targets:
-                    if len(target_name) < 5: continue
-                    text_instances = page.search_for(target_name)
-                    valid_name_instances = [rect for rect in text_instances if rect.x0 < 300]
-
-                    if valid_name_instances:
-                        print(f"   [ALVO] Localizado pelo NOME: {target_name}")
-                        for rect in valid_name_instances:
-                            annot = page.add_highlight_annot(rect)
-                            annot.set_colors(stroke=(0, 0.8, 1))
-                            annot.update()
-
-                            search_rect = pymupdf.Rect(0, rect.y0 - 2, page.rect.width, rect.y1 + 2)
-
-                            for val in valores:
-                                val_instances = page.search_for(val, clip=search_rect)
-                                if val_instances:
-                                    print(f"      [CONFIRMADO] Valor {val} batido!")
-                                    for v_rect in val_instances:
-                                        annot_v = page.add_highlight_annot(v_rect)
-                                        annot_v.set_colors(stroke=(0, 1, 0))
-                                        annot_v.update()
-                                        total_marks += 1
-
-    doc.save(output_path)
+                for row_no, rect, score, target_name in name_hits.get(page.number, []):
+                    log.info(f"Localizado pelo nome na página {page.number + 1} "
+                             f"(similaridade {score:.2f}): {target_name}")
+                    _add_mark(page, rect, (0, 0.8, 1), tag)
+                    marked = True
+
+                    item_marks += _highlight_row_values(page, page_index, row_no, valores, tag)
+
+            if marked: pages.append(page.number)
+
+        item['marcacao'] = {'paginas': pages, 'total': item_marks}
+        total_marks += item_marks
+
     return total_marks
 
 
+# --- PIPELINE ---
+def receive_uploads():
+    """
+    Lê o corpo multipart da requisição conforme chega. Cada extrato entra na extração assim que
+    termina de chegar, enquanto os seguintes ainda estão sendo recebidos.
+    Retorna (apuração, [(nome, hash, Future)]); a apuração é None se não veio no envio ou se o
+    corpo multipart está malformado ou truncado.
+    """
+    if request.mimetype != 'multipart/form-data': return None, []
+    apuracao, started = None, []
+    with telemetry.stage('upload_receive'):
+        try:
+            for field, source in upload_stream.iter_uploads(request.stream,
+                                                            request.mimetype_params.get('boundary', '')):
+                if field == 'apuracao_pdf':
+                    apuracao = source
+                elif field == 'extratos_pdfs':
+                    started.append(submit_extraction(source))
+        except ValueError as e:
+            # MultipartDecoder não consegue seguir num corpo inválido
+            log.warning(f"Envio multipart inválido: {e}")
+            apuracao = None
+    if apuracao is None:
+        for _, _, future in started: future.cancel()
+    return apuracao, started
+
+
+def output_name(job_id, filename_out):
+    """Nome de download da apuração marcada de uma auditoria (no blob_store)."""
+    return f"{job_id}/{filename_out}"
+
+
+def run_audit(apuracao, started, name_out, on_stage=None, on_progress=None, profile=False):
+    """
+    Extração, resolução dos fundos e marcação. Retorna o total de itens validados.
+    A apuração marcada vai para o blob_store com o nome de download `name_out`.
+    `started` são as extrações já disparadas ([(nome, hash, Future)] de submit_extraction).
+    Se a mesma apuração já foi auditada (INCREMENTAL_AUDIT), os extratos que não mudaram desde
+    então não são extraídos nem marcados de novo: a saída parte da anterior.
+    Ao final registra no log o tempo de cada etapa e os contadores da requisição.
+    """
+    profile_path = os.path.join(PROFILE_FOLDER, f"{telemetry.current_request_id()}.prof")
+    with telemetry.profiled(profile, profile_path):
+        apuracao_hash = upload_stream.source_sha256(apuracao)
+        names = {audit_state.statement_key(content_hash, extract_account_hint(name)): name
+                 for name, content_hash, _ in started}
+        previous = audit_state.load(apuracao_hash, AUDIT_STATE_VERSION) if INCREMENTAL_AUDIT else None
+        path_out = blob_store.temp_path('.pdf')
+        if previous:
+            # A cópia da saída anterior sai antes de decidir o que reaproveitar: se ela já foi
+            # removida do armazenamento, a rodada vira completa
+            try:
+                shutil.copyfile(previous['saida'], path_out)
+            except FileNotFoundError:
+                previous = None
+        reused = {}
+        if previous:
+            # Extratos com os fundos resolvendo para outros nomes são tratados como alterados
+            reused = unchanged_statements({key: st for key, st in previous['extratos'].items() if key in names})
+
+        # Extratos já marcados na saída anterior: a extração disparada no upload é descartada
+        pending = []
+        for i, (name, content_hash, future) in enumerate(started):
+            if audit_state.statement_key(content_hash, extract_account_hint(name)) in reused:
+                future.cancel()
+                if on_progress: on_progress(i, True)
+            else:
+                pending.append(i)
+        if previous:
+            log.info(f"Reauditoria: {len(reused)} extratos reaproveitados, {len(pending)} novos ou alterados")
+            telemetry.incr('statements_reused', len(reused))
+
+        if on_stage: on_stage('Extraindo extratos')
+        dados_audit = collect_statements(
+            [started[i] for i in pending],
+            on_progress=(lambda j, ok: on_progress(pending[j], ok)) if on_progress else None
+        )
+        for item in dados_audit:
+            item['chave'] = audit_state.statement_key(item['content_hash'], item['account_hint'])
+
+        if on_stage: on_stage('Consultando fundos')
+        attach_fund_names(dados_audit)
+
+        if on_stage: on_stage('Marcando apuração')
+        try:
+            if previous:
+                # Saem as marcações dos extratos retirados e dos que vão ser marcados de novo
+                removed = {key: st['paginas'] for key, st in previous['extratos'].items() if key not in reused}
+                total = update_audit_file(path_out, dados_audit, removed)
+                total += sum(st['total'] for st in reused.values())
+            else:
+                total = highlight_audit_file(apuracao, path_out, dados_audit)
+            with telemetry.stage('store'):
+                output_hash = blob_store.put_file(path_out, 'saida')
+        finally:
+            if os.path.exists(path_out): os.remove(path_out)
+        blob_store.link(name_out, output_hash)
+
+        if INCREMENTAL_AUDIT:
+            # Extratos que falharam ficam de fora: a próxima rodada tenta de novo. Os marcados sem a
+            # consulta dos fundos entram com nomes None, para que a próxima rodada os refaça
+            statements = dict(reused)
+            for item in dados_audit:
+                st = statements.setdefault(item['chave'], {'nome': names[item['chave']], 'paginas': [], 'total': 0,
+                                                           'cnpjs': item['cnpjs'], 'nomes': item['target_names']})
+                st['paginas'] = sorted(set(st['paginas']) | set(item['marcacao']['paginas']))
+                st['total'] += item['marcacao']['total']
+                if not item['nomes_ok']: st['nomes'] = None
+            audit_state.save(apuracao_hash, AUDIT_STATE_VERSION, blob_store.object_path(output_hash), statements)
+
+    log.info("Auditoria concluída", extra={'campos': telemetry.request_summary()})
+    return total
+
+
+def _profile_requested():
+    if not app.config['PROFILING_ENABLED']: return False
+    return request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+
+
+def _run_audit_job(job_id, apuracao, started, filename_out, profile=False):
+    # O job roda com as próprias estatísticas e com o id do job nos logs
+    telemetry.start_request(job_id)
+    total = run_audit(
+        apuracao, started, output_name(job_id, filename_out),
+        on_stage=lambda stage: jobs.update_job(job_id, stage=stage),
+        on_progress=lambda i, ok: jobs.update_job(job_id, statement=(i, 'done' if ok else 'error')),
+        profile=profile
+    )
+    jobs.update_job(job_id, status='done', stage='Concluído', output_filename=filename_out,
+                    message=f"Correção Concluída! {total} itens validados.")
+
+
+def _job_payload(job):
+    payload = {k: v for k, v in job.items() if k != 'output_filename'}
+    payload['status_url'] = url_for('job_status', job_id=job['id'])
+    payload['events_url'] = url_for('job_events', job_id=job['id'])
+    if job['status'] == 'done':
+        payload['file_url'] = url_for('job_result', job_id=job['id'])
+    return payload
+
+
 # --- ROTAS ---
+@app.before_request
+def start_request_telemetry():
+    telemetry.start_request(request.headers.get('X-Request-ID'))
+
+
+@app.after_request
+def tag_request_id(response):
+    response.headers['X-Request-ID'] = telemetry.current_request_id()
+    return response
+
+
 @app.route('/process', methods=['POST'])
 def process_audit():
-    if 'apuracao_pdf' not in request.files: return jsonify({'error': 'Erro arquivo'}), 400
-    apuracao = request.files['apuracao_pdf']
-    extratos = request.files.getlist('extratos_pdfs')
+    job_id = jobs.new_job_id()
+    apuracao, started = receive_uploads()
+    if apuracao is None: return jsonify({'error': 'Erro arquivo'}), 400
+    filename_out = "Correcao_" + upload_stream.source_name(apuracao)
 
-    path_apuracao = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(apuracao.filename))
-    apuracao.save(path_apuracao)
+    total = run_audit(apuracao, started, output_name(job_id, filename_out), profile=_profile_requested())
 
-    dados_audit = []
-    for ext in extratos:
-        if not ext.filename: continue
-        p = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(ext.filename))
-        ext.save(p)
-        res = extract_advanced_data(p)
-        if res:
-            dados_audit.append(res)
+    msg = f"Correção Concluída! {total} itens validados."
+    return jsonify({'message': msg, 'file_url': url_for('download_file', job_id=job_id, filename=filename_out)})
 
-    filename_out = "Correcao_" + secure_filename(apuracao.filename)
-    path_out = os.path.join(app.config['OUTPUT_FOLDER'], filename_out)
 
-    total = highlight_audit_file(path_apuracao, path_out, dados_audit)
+@app.route('/jobs', methods=['POST'])
+def create_audit_job():
+    job_id = jobs.new_job_id()
+    apuracao, started = receive_uploads()
+    if apuracao is None: return jsonify({'error': 'Erro arquivo'}), 400
+    filename_out = "Correcao_" + upload_stream.source_name(apuracao)
 
-    msg = f"Correção Concluída! {total} itens validados."
-    return jsonify({'message': msg, 'file_url': url_for('download_file', filename=filename_out)})
+    jobs.create_job([name for name, _, _ in started], job_id=job_id)
+    jobs.submit(job_id, _run_audit_job, apuracao, started, filename_out, _profile_requested())
+    return jsonify(_job_payload(jobs.get_job(job_id))), 202
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.get_job(job_id)
+    if job is None: return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify(_job_payload(job))
+
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    job = jobs.get_job(job_id)
+    if job is None: return jsonify({'error': 'Job não encontrado'}), 404
+
+    def stream():
+        current = job
+        while current is not None:
+            yield f"data: {json.dumps(_job_payload(current))}\n\n"
+            if current['status'] in ('done', 'error'): break
+            version = current['version']
+            current = jobs.wait_for_update(job_id, version)
+            while current is not None and current['version'] == version:
+                yield ": keep-alive\n\n"  # mantém a conexão aberta atrás do proxy
+                current = jobs.wait_for_update(job_id, version)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = jobs.get_job(job_id)
+    if job is None: return jsonify({'error': 'Job não encontrado'}), 404
+    if job['status'] != 'done': return jsonify({'error': 'Resultado ainda não está pronto', 'status': job['status']}), 409
+    return send_output(job['id'], job['output_filename'])
+
+
+@app.route('/download/<job_id>/<filename>')
+def download_file(job_id, filename):
+    return send_output(job_id, filename)
+
+
+def send_output(job_id, filename):
+    # O ETag é o hash do conteúdo: um download repetido com If-None-Match recebe 304 sem corpo
+    stored = blob_store.resolve(output_name(job_id, filename))
+    if stored is None: return jsonify({'error': 'Arquivo não encontrado ou expirado'}), 404
+    content_hash, path = stored
+    return send_file(path, mimetype='application/pdf', download_name=filename,
+                     etag=content_hash, conditional=True)
+
+
+@app.route('/cache', methods=['DELETE'])
+@app.route('/cache/<content_hash>', methods=['DELETE'])
+def invalidate_cache(content_hash=None):
+    removed = extraction_cache.invalidate(content_hash)
+    if content_hash is None:
+        # Sem extrações guardadas, as reauditorias também voltam a marcar do zero
+        audit_state.invalidate()
+    return jsonify({'message': f"{removed} extrações removidas do cache."})
 
 
-@app.route('/download/<filename>')
-def download_file(filename):
-    return send_from_directory(app.config['OUTPUT_FOLDER'], filename)
+@app.route('/metrics')
+def metrics():
+    return Response(telemetry.render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/')
@@ -0,0 +1,194 @@
+import re
+import math
+import unicodedata
+from collections import Counter
+import pymupdf
+from main import value_to_cents
+
+# Índice da apuração montado uma única vez por documento a partir de page.get_text("words").
+# Cada página vira uma lista de linhas visuais (palavras agrupadas pela altura, atravessando as
+# colunas da tabela) e um mapa token -> posições, para que conta, nome e valores sejam
+# resolvidos por consulta em memória em vez de um page.search_for por combinação.
+# Todo token monetário também entra num mapa centavos -> posições, para que os valores dos
+# extratos sejam cruzados pelo valor numérico e não pelo texto ('1234,56' == 'R$ 1.234,56').
+
+# Os nomes de fundo da coluna da esquerda entram num índice de trigramas de caracteres (uma vez
+# por documento), e o nome vindo do banco é ranqueado por similaridade contra ele; assim nomes
+# abreviados ou truncados na apuração ainda são encontrados. Cada trigrama pesa pelo inverso da
+# frequência entre as linhas: o jargão que quase todo nome repete ('RF REFERENCIADO DI FI LP')
+# quase não conta, e o que separa dois fundos do mesmo gestor é o que decide.
+
+# Folga vertical (pt) usada para decidir se uma palavra pertence à mesma linha
+ROW_TOLERANCE = 2
+# Pontuação descartada nas pontas das palavras antes de indexar
+_EDGE_PUNCTUATION = '()[]{};:"\''
+# Só a coluna da esquerda (x0 menor que isso) é considerada nome de fundo
+NAME_COLUMN_MAX_X0 = 300
+# Abreviações usuais nas apurações, aplicadas aos dois lados antes de gerar os trigramas
+_FUND_NAME_ABBREVIATIONS = [
+    ('FUNDO DE INVESTIMENTO EM COTAS DE FUNDOS DE INVESTIMENTO', 'FIC FI'),
+    ('FUNDO DE INVESTIMENTO EM COTAS', 'FIC'),
+    ('FUNDOS DE INVESTIMENTO', 'FI'),
+    ('FUNDO DE INVESTIMENTO', 'FI'),
+    ('RENDA FIXA', 'RF'),
+    ('LONGO PRAZO', 'LP'),
+    ('CREDITO PRIVADO', 'CP'),
+    ('TITULOS PUBLICOS', 'TP'),
+]
+_IDENTIFIER = re.compile(r'^[\d\-/.,]+$|\d+-[0-9X]$')
+
+
+def normalize_token(word):
+    return word.strip(_EDGE_PUNCTUATION).upper()
+
+
+def build_page_index(page):
+    """
+    Retorna {'rows': [...], 'tokens': {...}, 'cents': {...}} para a página.
+    Cada linha é {'rect', 'words': [(Rect, token)], 'tokens': {token: [Rect]}, 'cents': {centavos: [Rect]}}
+    e os mapas globais da página apontam token/centavos -> [(número da linha, Rect)].
+    """
+    words = page.get_text("words")
+    words.sort(key=lambda w: ((w[1] + w[3]) / 2, w[0]))
+
+    rows = []
+    current = None
+    for x0, y0, x1, y1, text, *_ in words:
+        token = normalize_token(text)
+        if not token: continue
+        center = (y0 + y1) / 2
+        if current is None or not (current['band'][0] <= center <= current['band'][1]):
+            current = {'band': (y0 - ROW_TOLERANCE, y1 + ROW_TOLERANCE), 'rect': pymupdf.Rect(x0, y0, x1, y1),
+                       'words': []}
+            rows.append(current)
+        rect = pymupdf.Rect(x0, y0, x1, y1)
+        current['rect'] |= rect
+        current['words'].append((rect, token))
+
+    tokens = {}
+    cents = {}
+    for row_no, row in enumerate(rows):
+        row['words'].sort(key=lambda w: w[0].x0)
+        row['tokens'] = {}
+        row['cents'] = {}
+        for rect, token in row['words']:
+            row['tokens'].setdefault(token, []).append(rect)
+            tokens.setdefault(token, []).append((row_no, rect))
+            value = value_to_cents(token)
+            if value is not None:
+                row['cents'].setdefault(value, []).append(rect)
+                cents.setdefault(value, []).append((row_no, rect))
+
+    return {'rows': rows, 'tokens': tokens, 'cents': cents}
+
+
+def build_document_index(doc):
+    return [build_page_index(page) for page in doc]
+
+
+def find_token_containing(page_index, text, max_x0):
+    """Palavras que contêm `text` (como o search_for) e começam antes de max_x0."""
+    needle = text.upper()
+    return [(row_no, rect)
+            for token, positions in page_index['tokens'].items() if needle in token
+            for row_no, rect in positions if rect.x0 < max_x0]
+
+
+def normalize_fund_name(text):
+    text = unicodedata.normalize('NFKD', text.upper())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = ' '.join(re.sub(r'[^A-Z0-9+\-/ ]', ' ', text).split())
+    for long_form, short_form in _FUND_NAME_ABBREVIATIONS:
+        text = text.replace(long_form, short_form)
+    return text
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def build_name_index(doc_index):
+    """
+    Índice de trigramas da coluna de nomes de todas as páginas.
+    Retorna {'postings': {trigrama: [(página, linha)]}, 'weights': {trigrama: peso},
+    'rows': {(página, linha): (Rect, soma dos pesos dos trigramas)}}.
+    Números, contas e valores da coluna ficam de fora para não diluir a similaridade.
+    """
+    postings = {}
+    row_grams = {}
+    rects = {}
+    for page_no, page_index in enumerate(doc_index):
+        for row_no, row in enumerate(page_index['rows']):
+            words = [(rect, token) for rect, token in row['words']
+                     if rect.x0 < NAME_COLUMN_MAX_X0 and not _IDENTIFIER.search(token)]
+            if not words: continue
+            grams = trigrams(normalize_fund_name(' '.join(token for _, token in words)))
+            rect = pymupdf.Rect(words[0][0])
+            for r, _ in words[1:]: rect |= r
+            rects[(page_no, row_no)] = rect
+            row_grams[(page_no, row_no)] = grams
+            for gram in grams:
+                postings.setdefault(gram, []).append((page_no, row_no))
+
+    weights = {gram: _gram_weight(len(rows), len(row_grams)) for gram, rows in postings.items()}
+    rows = {key: (rects[key], sum(weights[gram] for gram in grams)) for key, grams in row_grams.items()}
+    return {'postings': postings, 'weights': weights, 'rows': rows}
+
+
+def _gram_weight(rows_with_gram, total_rows):
+    # Inverso da frequência entre as linhas; um trigrama ausente da apuração pesa como o mais raro
+    return math.log((total_rows + 1) / max(rows_with_gram, 1))
+
+
+def find_fund_name(name_index, fund_name, threshold):
+    """
+    Linhas cuja coluna de nome se parece com `fund_name`: coeficiente de Dice sobre trigramas,
+    cada um com o peso de build_name_index. Só as linhas que compartilham algum trigrama com o
+    nome são visitadas. Retorna (matches, segunda): matches são as de maior similaridade (empates
+    incluídos) que passam do limiar, [(página, linha, Rect, similaridade)], e segunda é a maior
+    similaridade abaixo delas (0 se não há), para o chamador ver se a escolha foi apertada.
+    """
+    grams = trigrams(normalize_fund_name(fund_name))
+    if not grams: return [], 0.0
+    total_rows = len(name_index['rows'])
+    weights = {gram: name_index['weights'].get(gram) or _gram_weight(0, total_rows) for gram in grams}
+    shared = Counter()
+    for gram in grams:
+        for key in name_index['postings'].get(gram, ()):
+            shared[key] += weights[gram]
+
+    size = sum(weights.values())
+    scores = sorted(((2 * common / (name_index['rows'][key][1] + size), key) for key, common in shared.items()),
+                    reverse=True)
+    if not scores or scores[0][0] < threshold: return [], scores[0][0] if scores else 0.0
+    # Somas de pesos em float: empates de verdade podem diferir na última casa
+    best = scores[0][0]
+    matches = [(key[0], key[1], name_index['rows'][key][0], score) for score, key in scores
+               if math.isclose(score, best)]
+    runner_up = next((score for score, _ in scores if not math.isclose(score, best)), 0.0)
+    return matches, runner_up
+
+
+def build_value_lookup(values, tolerance=0):
+    """
+    Lado de construção do cruzamento: {centavos: valor original} dos valores de um extrato.
+    Com tolerance > 0, cada valor também responde pelos centavos vizinhos (arredondamentos).
+    Valores iguais em centavos mas escritos de outro jeito ficam com a primeira grafia.
+    """
+    lookup = {}
+    for value in values:
+        cents = value_to_cents(value)
+        if cents is None: continue
+        for delta in range(-tolerance, tolerance + 1):
+            lookup.setdefault(cents + delta, value)
+    return lookup
+
+
+def find_values_in_row(page_index, row_no, lookup):
+    """
+    Lado de consulta: percorre uma vez os tokens monetários da linha e sonda `lookup`
+    (de build_value_lookup). Retorna [(valor do extrato, [Rect])].
+    """
+    row_cents = page_index['rows'][row_no]['cents']
+    return [(lookup[cents], rects) for cents, rects in row_cents.items() if cents in lookup]
@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+
+# Estado da última auditoria de cada apuração (pelo hash do conteúdo): o PDF marcado e, por extrato,
+# as páginas em que ele deixou marcações e quantos valores bateu. Numa nova rodada com a mesma
+# apuração, os extratos que já estavam lá são reaproveitados; só os novos ou alterados são
+# processados e os que saíram têm as marcações removidas (cada anotação leva a chave do extrato).
+# Como as marcações dependem também dos nomes dos fundos, cada extrato guarda os CNPJs e os nomes
+# resolvidos na rodada; nomes None indicam que a consulta falhou e o extrato é refeito na próxima.
+STATE_PATH = os.environ.get('AUDIT_STATE_PATH', os.path.join('cache', 'auditorias.sqlite3'))
+
+log = logging.getLogger('corretor.auditorias')
+
+
+def statement_key(content_hash, account_hint):
+    """Chave de um extrato: o conteúdo e a dica de conta (que vem do nome e muda as marcações)."""
+    return hashlib.sha256(f"{content_hash}:{account_hint or ''}".encode()).hexdigest()[:32]
+
+
+def annotation_tag(key):
+    """Valor gravado no 'subject' das anotações de um extrato."""
+    return f"extrato:{key}"
+
+
+def _connect():
+    os.makedirs(os.path.dirname(STATE_PATH) or '.', exist_ok=True)
+    conn = sqlite3.connect(STATE_PATH, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS auditorias (
+            apuracao TEXT PRIMARY KEY,
+            versao TEXT NOT NULL,
+            saida TEXT NOT NULL,
+            atualizado REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS marcacoes (
+            apuracao TEXT NOT NULL,
+            extrato TEXT NOT NULL,
+            nome TEXT NOT NULL,
+            paginas TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            cnpjs TEXT,
+            nomes TEXT,
+            PRIMARY KEY (apuracao, extrato)
+        )
+    """)
+    # Bancos criados antes das colunas de fundos: as linhas antigas ficam sem CNPJs e são refeitas
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(marcacoes)')}
+    for column in ('cnpjs', 'nomes'):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE marcacoes ADD COLUMN {column} TEXT')
+    return conn
+
+
+def _json_or_none(value):
+    return None if value is None else json.loads(value)
+
+
+def load(apuracao_hash, version):
+    """
+    Última auditoria da apuração feita com a mesma versão de regras, ou None (também se o PDF de
+    saída não existe mais). Retorna {'saida': caminho,
+    'extratos': {chave: {'nome', 'paginas', 'total', 'cnpjs', 'nomes'}}}; 'cnpjs' e 'nomes' podem ser None.
+    """
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute('SELECT versao, saida FROM auditorias WHERE apuracao = ?', (apuracao_hash,)).fetchone()
+            if row is None or row[0] != version or not os.path.exists(row[1]): return None
+            statements = {
+                key: {'nome': nome, 'paginas': json.loads(paginas), 'total': total,
+                      'cnpjs': _json_or_none(cnpjs), 'nomes': _json_or_none(nomes)}
+                for key, nome, paginas, total, cnpjs, nomes in conn.execute(
+                    'SELECT extrato, nome, paginas, total, cnpjs, nomes FROM marcacoes WHERE apuracao = ?',
+                    (apuracao_hash,))
+            }
+            return {'saida': row[1], 'extratos': statements}
+        finally:
+            conn.close()
+    except Exception as e:
+        log.warning(f"Falha ao ler o estado da auditoria: {e}")
+        return None
+
+
+def save(apuracao_hash, version, output_path, statements):
+    """Substitui o estado da apuração pelo da auditoria que acabou de gravar `output_path`."""
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO auditorias VALUES (?, ?, ?, ?)',
+                             (apuracao_hash, version, output_path, time.time()))
+                conn.execute('DELETE FROM marcacoes WHERE apuracao = ?', (apuracao_hash,))
+                conn.executemany('INSERT INTO marcacoes (apuracao, extrato, nome, paginas, total, cnpjs, nomes) '
+                                 'VALUES (?, ?, ?, ?, ?, ?, ?)', [
+                    (apuracao_hash, key, st['nome'], json.dumps(st['paginas']), st['total'],
+                     json.dumps(st['cnpjs']), None if st['nomes'] is None else json.dumps(st['nomes']))
+                    for key, st in statements.items()
+                ])
+        finally:
+            conn.close()
+    except Exception as e:
+        log.warning(f"Falha ao gravar o estado da auditoria: {e}")
+
+
+def invalidate(apuracao_hash=None):
+    """Esquece uma apuração ou todas: a próxima rodada marca do zero. Retorna quantas saíram."""
+    conn = _connect()
+    try:
+        with conn:
+            if apuracao_hash:
+                conn.execute('DELETE FROM marcacoes WHERE apuracao = ?', (apuracao_hash,))
+                return conn.execute('DELETE FROM auditorias WHERE apuracao = ?', (apuracao_hash,)).rowcount
+            conn.execute('DELETE FROM marcacoes')
+            return conn.execute('DELETE FROM auditorias').rowcount
+    finally:
+        conn.close()
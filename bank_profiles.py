@@ -0,0 +1,211 @@
+import re
+
+# Registro único dos bancos: palavras de detecção, padrões de valores e filtros, usados tanto
+# pelo app.py (arrastão de valores + CNPJs) quanto pelo main.py (padrões por rótulo).
+# Incluir um banco novo é só acrescentar um dict em PROFILES e a chave dele em DETECTION_ORDER.
+#
+# Os padrões são compilados uma vez na importação e o texto de cada página é normalizado uma vez
+# por extrator (normalize_page), em vez de refeito a cada padrão. Cada padrão roda separado: no
+# re do CPython uma alternância única de todos os padrões de um banco mede 10-25x mais lenta que
+# padrões separados que começam por literal (benchmarks/bench_bank_profiles.py).
+#
+# Campos de um perfil:
+#   key, code       -- identificador e código do banco (o código é o 'banco_detectado' do app.py)
+#   keywords        -- por extrator, palavras (em maiúsculas) que identificam o banco na página;
+#                      valem só como palavras inteiras ('BB' não casa com 'BBDC4')
+#   weak_keywords   -- idem, mas só valem se nenhum banco foi identificado pelas keywords
+#   app             -- padrões do arrastão do app.py, sobre o texto da página em maiúsculas
+#   main            -- padrões do main.py, sobre o texto com as quebras de linha trocadas por espaço
+#   cnpj            -- padrões extras de CNPJ do banco (texto em maiúsculas)
+#   sections        -- por extrator, regex de uma seção (grupo 1 = conteúdo): se o trecho tem
+#                      seções, só elas contam e, em cada uma, só a 1ª ocorrência de cada padrão
+# Cada padrão é {'regex': ..., 'skip': [valores descartados]}; todos os grupos do regex são valores.
+# A prioridade da detecção é a de DETECTION_ORDER, própria de cada extrator.
+
+# Valor isolado: 1.000,00 entre espaços (não consome o espaço, então dois valores seguidos saem os dois)
+ISOLATED_VALUE = {'regex': r'(?<!\S)([1-9]\d{0,2}(?:\.\d{3})*,\d{2})(?!\S)'}
+# Primeiro valor depois de uma palavra-chave, na mesma linha
+CONTEXT_VALUE = {'regex': r'(?:SALDO|TOTAL|VALOR|BRUTO|LÍQUIDO|ATUAL|FINAL|RESGATADO|APLICADO)'
+                          r'.*?([1-9]\d{0,2}(?:\.\d{3})*,\d{2})'}
+# Valor com sufixo de crédito/débito: 1.000,00C ou 1.000,00 D
+CD_SUFFIX_VALUE = {'regex': r'(?<!\S)([1-9]\d{0,2}(?:\.\d{3})*,\d{2})\s*[CD](?!\S)'}
+
+CNPJ_PATTERN = r'(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})'
+
+# Sem banco identificado, o app.py usa este código (e o arrastão genérico)
+DEFAULT_CODE = '11'
+
+PROFILES = [
+    {
+        'key': 'itau',
+        'code': '341',
+        'keywords': {'app': ['ITAÚ', 'ITAU'], 'main': ['ITAÚ']},
+        'app': [ISOLATED_VALUE, CONTEXT_VALUE],
+        'main': [
+            {'regex': r'SALDO BRUTO ATUAL\s+[\d,.]+\s+([\d.,]+)', 'skip': ['0,00']},
+            {'regex': r'APLICACOES\s+([\d.,]+)', 'skip': ['0,00']},
+            {'regex': r'RESGATES\s+([\d.,]+)', 'skip': ['0,00']},
+            {'regex': r'RENDIMENTO BRUTO NO MES\s+([\d.,]+)', 'skip': ['0,00']},
+        ],
+        # Itaú: 'CNPJ <número> Taxa' com o número fora do formato padrão
+        'cnpj': [{'regex': r'(?<!\S)CNPJ\s+(\S+)\s+TAXA(?!\S)'}],
+    },
+    {
+        'key': 'caixa',
+        'code': '104',
+        'keywords': {'app': ['CAIXA', 'CEF'], 'main': ['CAIXA', 'CEF']},
+        'weak_keywords': {'app': ['FUNDO DE INVESTIMENTO']},
+        'app': [CD_SUFFIX_VALUE, ISOLATED_VALUE, CONTEXT_VALUE],
+        'main': [
+            {'regex': r'Aplicações\s+([\d.,]+C?)', 'skip': ['0,00']},
+            {'regex': r'Resgates\s+([\d.,]+D?)', 'skip': ['0,00']},
+            {'regex': r'Saldo Bruto\*\s+([\d.,]+C?)', 'skip': ['0,00']},
+            {'regex': r'Rendimento Bruto no Mês\s+([\d.,]+C?)', 'skip': ['0,00']},
+            {'regex': r'Rendimento Bruto\s+R\$\s*([\d.,]+)', 'skip': ['0,00']},
+            {'regex': r'Saldo Bruto Final\s+R\$\s*([\d.,]+)', 'skip': ['0,00']},
+        ],
+    },
+    {
+        'key': 'bb',
+        'code': '1',
+        'keywords': {'app': ['BANCO DO BRASIL', 'BB'],
+                     'main': ['BANCO DO BRASIL', 'BB PREVID', 'BB PREVIDENCIA', 'BB PREVIDÊNCIA']},
+        'app': [ISOLATED_VALUE, CONTEXT_VALUE],
+        'main': [
+            {'regex': r'SALDO ATUAL\s*=\s*([\d.,]+)', 'skip': ['0,00']},
+            {'regex': r'APLICAÇÕES\s*\(\+\)\s*([\d.,]+)', 'skip': ['0,00']},
+            {'regex': r'RESGATES\s*\(\-\)\s*([\d.,]+)', 'skip': ['0,00']},
+            {'regex': r'RENDIMENTO BRUTO\s*\(\+\)\s*([\d.,]+)', 'skip': ['0,00']},
+        ],
+        # Só o quadro 'Resumo do mês' (até o próximo, o fim da transação ou o fim do trecho lido):
+        # o SALDO ATUAL de outros quadros do extrato não é o do fundo
+        'sections': {'main': r'Resumo do m[êe]s\s+(.*?)(?=Resumo do m[êe]s|Transação efetuada com sucesso|\Z)'},
+    },
+    {
+        'key': 'bradesco',
+        'code': '237',
+        'keywords': {'app': ['BRADESCO'], 'main': ['BRADESCO']},
+        'app': [ISOLATED_VALUE, CONTEXT_VALUE],
+        'main': [
+            {'regex': r'Saldo em\s+\d{2}/\d{2}/\d{4}\s+([\d.,]+)', 'skip': ['0.00', '0,00']},
+            {'regex': r'Saldo Final\s+[\d.,]+\s+[\d,.]+\s+([\d.,]+)', 'skip': ['0.00', '0,00']},
+            {'regex': r'Rendimento\s+Bruto\s+([\d.,]+)', 'skip': ['0.00', '0,00']},
+            {'regex': r'Aplicações no Período\s+([\d.,]+)', 'skip': ['0.00', '0,00']},
+            {'regex': r'Resgates no Período\s+[\d,.]+\s+([\d.,]+)', 'skip': ['0.00', '0,00']},
+        ],
+    },
+    {
+        'key': 'safra',
+        'code': '41',
+        'keywords': {'app': ['SAFRA']},
+        'app': [ISOLATED_VALUE, CONTEXT_VALUE],
+        'main': [],  # sem regras no main.py
+    },
+    {
+        'key': 'xp',
+        'code': DEFAULT_CODE,
+        'keywords': {'app': ['XP'], 'main': ['XP']},
+        'app': [ISOLATED_VALUE, CONTEXT_VALUE],
+        'main': [
+            # Títulos Públicos: saldo anterior e atual na mesma linha
+            {'regex': r'(\d{1,3}(?:\.\d{3})*,\d{2})\s+(\d{1,3}(?:\.\d{3})*,\d{2})\s+\d{1,3}(?:\.\d{3})*,\d+'},
+            {'regex': r'Saldo bruto atual:\s*R\$\s*([\d.,]+)', 'skip': ['00,00']},
+            {'regex': r'Total aplicado:\s*R\$\s*([\d.,]+)', 'skip': ['00,00']},
+            {'regex': r'Total resgatado:\s*R\$\s*([\d.,]+)', 'skip': ['00,00']},
+            {'regex': r'SALDO FINAL\s+[\d,.]+\s+([\d.,]+)', 'skip': ['00,00']},
+            {'regex': r'Rendimento Bruto\s+([\d.,]+)', 'skip': ['00,00']},
+        ],
+    },
+]
+
+# Ordem em que os bancos são testados. O main.py testa a XP primeiro: os extratos dela citam
+# outros bancos (ex.: 'CDB BANCO ITAU') como emissores dos papéis.
+DETECTION_ORDER = {
+    'app': ['itau', 'caixa', 'bb', 'bradesco', 'safra', 'xp'],
+    'main': ['xp', 'bb', 'caixa', 'bradesco', 'itau', 'safra'],
+}
+
+
+# --- COMPILAÇÃO ---
+def _compile(patterns):
+    return [(re.compile(p['regex']), frozenset(p.get('skip', ()))) for p in patterns]
+
+
+def _word(keyword):
+    return re.compile(r'(?<!\w)' + re.escape(keyword) + r'(?!\w)')
+
+
+_BY_CODE = {profile['code']: profile for profile in PROFILES}
+_BY_KEY = {profile['key']: profile for profile in PROFILES}
+# Por extrator, (palavra, regex de palavra inteira, perfil) na ordem de verificação: todas as
+# keywords antes de qualquer weak_keyword
+_KEYWORDS = {
+    extractor: [(keyword, _word(keyword), _BY_KEY[key]) for field in ('keywords', 'weak_keywords')
+                for key in order for keyword in _BY_KEY[key].get(field, {}).get(extractor, ())]
+    for extractor, order in DETECTION_ORDER.items()
+}
+_COMPILED = {
+    profile['key']: {
+        'app': _compile(profile.get('app', [])),
+        'main': _compile(profile.get('main', [])),
+        'cnpj': _compile([{'regex': CNPJ_PATTERN}] + profile.get('cnpj', [])),
+        'sections': {extractor: re.compile(regex, re.DOTALL)
+                     for extractor, regex in profile.get('sections', {}).items()},
+    }
+    for profile in PROFILES
+}
+
+
+def _scan(compiled, text):
+    for regex, skip in compiled:
+        for match in regex.finditer(text):
+            for value in match.groups():
+                if value and value not in skip:
+                    yield value
+
+
+# --- API ---
+def normalize_page(text, extractor):
+    """Texto da página na forma que os padrões do extrator esperam ('app': maiúsculas, 'main': uma linha só)."""
+    if extractor == 'main': return text.replace("\n", " ")
+    return text.upper()
+
+
+def detect(text, extractor='app'):
+    """Perfil do banco identificado no texto (o primeiro de DETECTION_ORDER do extrator) ou None."""
+    text_upper = text.upper()
+    for keyword, word, profile in _KEYWORDS[extractor]:
+        # A busca simples descarta rápido as palavras ausentes; a regex confirma a palavra inteira
+        if keyword in text_upper and word.search(text_upper): return profile
+    return None
+
+
+def by_code(code):
+    return _BY_CODE.get(code)
+
+
+def scan_values(profile, text, extractor):
+    """Valores do texto já normalizado (normalize_page) pelos padrões do extrator ('app' ou 'main')."""
+    return _scan(_COMPILED[profile['key']][extractor], text)
+
+
+def scan_sections(profile, text, extractor):
+    """
+    Valores das seções do perfil no texto normalizado: em cada seção, a primeira ocorrência de
+    cada padrão do extrator. None se o perfil não define seções ou o texto não tem nenhuma.
+    """
+    section = _COMPILED[profile['key']]['sections'].get(extractor)
+    if section is None: return None
+    contents = section.findall(text)
+    if not contents: return None
+    values = []
+    for content in contents:
+        for regex, skip in _COMPILED[profile['key']][extractor]:
+            match = regex.search(content)
+            if match:
+                values += [v for v in match.groups() if v and v not in skip]
+    return values
+
+
+def scan_cnpjs(profile, text_upper):
+    return _scan(_COMPILED[profile['key']]['cnpj'], text_upper)
@@ -0,0 +1,188 @@
+"""
+Custo por página da varredura de valores: regexes antigas (re.findall com IGNORECASE e o texto
+refeito a cada padrão) contra o registro de bank_profiles (padrões pré-compilados sobre o texto
+normalizado uma vez). Mede também a alternativa de uma alternância única por banco, que no re do
+CPython perde a busca rápida pelo prefixo literal de cada padrão.
+
+Uso: python benchmarks/bench_bank_profiles.py [--por-banco 3] [--paginas 3] [--repeticoes 20]
+
+As páginas vêm do conjunto sintético de benchmarks/synthetic.py (primeira página de cada extrato
+com os rótulos do banco e páginas de movimentação). Mostra também se os dois lados acham os
+mesmos valores, para que a comparação seja entre trabalhos equivalentes.
+"""
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pymupdf
+import synthetic
+import bank_profiles
+from main import normalize_value, extract_values_from_text
+
+
+# --- ANTES: app.py ---
+def legacy_app_bank(text):
+    text_upper = text.upper()
+    if "ITAÚ" in text_upper or "ITAU" in text_upper: return '341'
+    if "CAIXA" in text_upper or "FUNDO DE INVESTIMENTO" in text_upper: return '104'
+    if "BANCO DO BRASIL" in text_upper or "BB" in text_upper: return '1'
+    if "BRADESCO" in text_upper: return '237'
+    if "SAFRA" in text_upper: return '41'
+    return '11'
+
+
+def legacy_app_page(text, extrato):
+    found = re.findall(r'\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}', text)
+    if extrato == '341':
+        split_text = text.split()
+        for i in range(len(split_text)):
+            if split_text[i] == 'CNPJ' and (i + 2 < len(split_text)) and split_text[i + 2] == 'Taxa':
+                found.append(split_text[i + 1])
+    found += re.findall(r'(?:\s|^)([1-9]\d{0,2}(?:\.\d{3})*,\d{2})(?:\s|$)', text)
+    if extrato == '104':
+        found += re.findall(r'(?:\s|^)([1-9]\d{0,2}(?:\.\d{3})*,\d{2})(?:\s*[CDcd])(?:\s|$)', text)
+    keywords = r'(?:SALDO|TOTAL|VALOR|BRUTO|LÍQUIDO|ATUAL|FINAL|RESGATADO|APLICADO)'
+    found += re.findall(rf'{keywords}.*?([1-9]\d{{0,2}}(?:\.\d{{3}})*,\d{{2}})', text, re.IGNORECASE)
+    return found
+
+
+# --- ANTES: main.py ---
+LEGACY_MAIN_PATTERNS = {
+    'itau': [r"SALDO BRUTO ATUAL\s+[\d,.]+\s+([\d.,]+)", r"APLICACOES\s+([\d.,]+)", r"RESGATES\s+([\d.,]+)",
+             r"RENDIMENTO BRUTO NO MES\s+([\d.,]+)"],
+    'caixa': [r"Aplicações\s+([\d.,]+C?)", r"Resgates\s+([\d.,]+D?)", r"Saldo Bruto\*\s+([\d.,]+C?)",
+              r"Rendimento Bruto no Mês\s+([\d.,]+C?)", r"Rendimento Bruto\s+R\$\s*([\d.,]+)",
+              r"Saldo Bruto Final\s+R\$\s*([\d.,]+)"],
+    'bradesco': [r"Saldo em\s+\d{2}/\d{2}/\d{4}\s+([\d.,]+)", r"Saldo Final\s+[\d.,]+\s+[\d,.]+\s+([\d.,]+)",
+                 r"Rendimento\s+Bruto\s+([\d.,]+)", r"Aplicações no Período\s+([\d.,]+)",
+                 r"Resgates no Período\s+[\d,.]+\s+([\d.,]+)"],
+    'xp': [r"Saldo bruto atual:\s*R\$\s*([\d.,]+)", r"Total aplicado:\s*R\$\s*([\d.,]+)",
+           r"Total resgatado:\s*R\$\s*([\d.,]+)", r"SALDO FINAL\s+[\d,.]+\s+([\d.,]+)", r"Rendimento Bruto\s+([\d.,]+)"],
+    'bb': [r"SALDO ATUAL\s*=\s*([\d.,]+)", r"APLICAÇÕES\s*\(\+\)\s*([\d.,]+)", r"RESGATES\s*\(\-\)\s*([\d.,]+)",
+           r"RENDIMENTO BRUTO\s*\(\+\)\s*([\d.,]+)"],
+}
+
+
+def legacy_main_page(text):
+    lower = text.lower()
+    if 'xp' in lower: bank = 'xp'
+    elif 'banco do brasil' in lower or 'bb previd' in lower: bank = 'bb'
+    elif 'caixa' in lower or 'cef' in lower: bank = 'caixa'
+    elif 'bradesco' in lower: bank = 'bradesco'
+    elif 'itaú' in lower: bank = 'itau'
+    else: return []
+    found = []
+    if bank == 'xp':
+        padrao_tp = r'(\d{1,3}(?:\.\d{3})*,\d{2})\s+(\d{1,3}(?:\.\d{3})*,\d{2})\s+\d{1,3}(?:\.\d{3})*,\d+'
+        for match in re.findall(padrao_tp, text):
+            found += [normalize_value(match[0]), normalize_value(match[1])]
+    for pattern in LEGACY_MAIN_PATTERNS[bank]:
+        for match in re.findall(pattern, text.replace("\n", " ")):
+            if match and match not in ('0,00', '0.00', '00,00'): found.append(normalize_value(match))
+    return found
+
+
+# --- DEPOIS: bank_profiles ---
+def registry_app_page(text, extrato):
+    profile = bank_profiles.by_code(extrato)
+    page_text = bank_profiles.normalize_page(text, 'app')
+    return list(bank_profiles.scan_cnpjs(profile, page_text)) + list(bank_profiles.scan_values(profile, page_text, 'app'))
+
+
+def registry_main_page(text):
+    profile = bank_profiles.detect(text, 'main')
+    if profile is None: return []
+    return extract_values_from_text(profile, text)[0]
+
+
+# --- ALTERNATIVA: uma alternância por banco (só o custo da varredura) ---
+_ALTERNATIONS = {
+    profile['key']: {
+        extractor: re.compile('|'.join(f"({p['regex']})" for p in profile[extractor])) if profile[extractor] else None
+        for extractor in ('app', 'main')
+    }
+    for profile in bank_profiles.PROFILES
+}
+
+
+def alternation_app_page(text, extrato):
+    profile = bank_profiles.by_code(extrato)
+    page_text = bank_profiles.normalize_page(text, 'app')
+    return list(bank_profiles.scan_cnpjs(profile, page_text)) + list(
+        _ALTERNATIONS[profile['key']]['app'].finditer(page_text))
+
+
+def alternation_main_page(text):
+    profile = bank_profiles.detect(text, 'main')
+    if profile is None or _ALTERNATIONS[profile['key']]['main'] is None: return []
+    return list(_ALTERNATIONS[profile['key']]['main'].finditer(bank_profiles.normalize_page(text, 'main')))
+
+
+def load_pages(args, tmp_dir):
+    manifest = synthetic.generate(tmp_dir, args.por_banco, args.paginas, args.seed, raster=False)
+    pages = []
+    for st in manifest['extratos']:
+        with pymupdf.open(st['arquivo']) as doc:
+            for page in doc:
+                pages.append((page.get_text(), page.get_text("text", sort=True), st['banco']))
+    return pages
+
+
+def measure(fn, items, repeats):
+    per_page = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for item in items: fn(*item)
+        per_page.append((time.perf_counter() - start) / len(items) * 1e6)
+    return statistics.median(per_page), max(per_page)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--por-banco', type=int, default=3)
+    parser.add_argument('--paginas', type=int, default=3)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='bench_bancos_')
+    try:
+        pages = load_pages(args, tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # O banco do app é detectado uma vez por extrato; aqui usa o do manifesto para isolar a varredura
+    app_items = [(raw, bank) for raw, _, bank in pages]
+    main_items = [(sorted_text,) for _, sorted_text, _ in pages]
+    cases = [
+        ('app', legacy_app_page, registry_app_page, alternation_app_page, app_items),
+        ('main', legacy_main_page, registry_main_page, alternation_main_page, main_items),
+    ]
+
+    print(f"{len(pages)} páginas, {args.repeticoes} repetições (µs por página: mediana / pior)")
+    for name, legacy, registry, alternation, items in cases:
+        legacy_med, legacy_max = measure(legacy, items, args.repeticoes)
+        registry_med, registry_max = measure(registry, items, args.repeticoes)
+        alternation_med, alternation_max = measure(alternation, items, args.repeticoes)
+        same = sum(set(legacy(*item)) == set(registry(*item)) for item in items)
+        print(f"  {name:<5} antes {legacy_med:7.1f} / {legacy_max:7.1f}   "
+              f"registro {registry_med:7.1f} / {registry_max:7.1f}   "
+              f"alternância {alternation_med:7.1f} / {alternation_max:7.1f}   "
+              f"({legacy_med / registry_med:.2f}x; mesmos valores que antes em {same}/{len(items)} páginas)")
+
+    started = time.perf_counter()
+    for raw, _, _ in pages: bank_profiles.detect(raw, 'app')
+    detect_us = (time.perf_counter() - started) / len(pages) * 1e6
+    started = time.perf_counter()
+    for raw, _, _ in pages: legacy_app_bank(raw)
+    legacy_detect_us = (time.perf_counter() - started) / len(pages) * 1e6
+    print(f"  detecção do banco: antes {legacy_detect_us:.1f} µs, registro {detect_us:.1f} µs por página")
@@ -0,0 +1,59 @@
+"""
+Mede o custo por página do OCR com cada backend do ocr_engine (pytesseract x tesserocr)
+num extrato escaneado de várias páginas.
+
+Uso: python benchmarks/bench_ocr_engine.py extrato_escaneado.pdf [--repeticoes 1]
+
+As páginas são renderizadas uma vez antes da medição, então o tempo reportado é só o do
+reconhecimento (incluindo, no pytesseract, o processo e os arquivos temporários de cada chamada).
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymupdf
+import app
+import ocr_engine
+
+
+def measure(backend, images, repeats):
+    ocr_engine.OCR_BACKEND = backend
+    # Aquece o backend (carrega o modelo 'por' na thread) fora da medição
+    ocr_engine.recognize(images[0])
+    timings = []
+    for _ in range(repeats):
+        for img in images:
+            start = time.perf_counter()
+            ocr_engine.recognize(img)
+            timings.append(time.perf_counter() - start)
+    return sorted(t * 1000 for t in timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pdf')
+    parser.add_argument('--repeticoes', type=int, default=1)
+    args = parser.parse_args()
+
+    with pymupdf.open(args.pdf) as doc:
+        images = [app.render_page_for_ocr(page) for page in doc]
+    print(f"Arquivo: {args.pdf} ({len(images)} páginas, {app.OCR_DPI} dpi)")
+
+    backends = ['pytesseract'] + (['tesserocr'] if ocr_engine.tesserocr is not None else [])
+    if len(backends) == 1:
+        print("  tesserocr não está instalado; medindo apenas o pytesseract.")
+
+    results = {}
+    for backend in backends:
+        timings = measure(backend, images, args.repeticoes)
+        results[backend] = statistics.mean(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"  {backend:<12} média={results[backend]:8.1f} ms/página  p95={p95:8.1f} ms")
+
+    if len(results) == 2:
+        saved = results['pytesseract'] - results['tesserocr']
+        print(f"  Economia por página: {saved:.1f} ms ({100 * saved / results['pytesseract']:.0f}%)")
@@ -0,0 +1,74 @@
+"""
+Compara a renderização para OCR antiga (RGB -> PNG -> PIL -> 'L' -> ImageEnhance) com a atual
+(pixmap em cinza compartilhado com o PIL + contraste por LUT).
+
+Uso: python benchmarks/bench_render.py extrato_escaneado.pdf [--dpi 144]
+
+Cada variante roda num processo separado para que o pico de memória (ru_maxrss) de uma
+não contamine a outra.
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import resource
+import statistics
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymupdf
+from PIL import Image, ImageEnhance
+
+
+def render_legacy(page, dpi):
+    pix = page.get_pixmap(matrix=pymupdf.Matrix(dpi / 72, dpi / 72))
+    img = Image.open(io.BytesIO(pix.tobytes()))
+    img = img.convert('L')
+    return ImageEnhance.Contrast(img).enhance(2)
+
+
+def render_current(page, dpi):
+    return app.render_page_for_ocr(page, dpi)
+
+
+def _measure(variant, pdf_path, dpi, queue):
+    global app
+    import app  # importado antes da medição nas duas variantes para não contar o Flask no pico
+    render = render_legacy if variant == 'antigo' else render_current
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    with pymupdf.open(pdf_path) as doc:
+        for page in doc:
+            start = time.perf_counter()
+            img = render(page, dpi)
+            img.load()
+            timings.append(time.perf_counter() - start)
+            del img
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((timings, peak_rss - baseline_rss))
+
+
+def run_variant(variant, pdf_path, dpi):
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_measure, args=(variant, pdf_path, dpi, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pdf')
+    parser.add_argument('--dpi', type=int, default=144)
+    args = parser.parse_args()
+
+    print(f"Arquivo: {args.pdf} ({args.dpi} dpi)")
+    for variant in ('antigo', 'atual'):
+        timings, rss_kb = run_variant(variant, args.pdf, args.dpi)
+        timings_ms = sorted(t * 1000 for t in timings)
+        p95 = timings_ms[min(len(timings_ms) - 1, int(len(timings_ms) * 0.95))]
+        print(f"  {variant:<7} páginas={len(timings_ms):<4} média={statistics.mean(timings_ms):7.1f} ms  "
+              f"p95={p95:7.1f} ms  pico de memória=+{rss_kb / 1024:.1f} MB")
@@ -0,0 +1,212 @@
+"""
+Teste de carga: N auditorias simultâneas, todas com os mesmos nomes de arquivo, distribuídas
+entre vários processos (como workers do gunicorn) que compartilham o armazenamento de jobs.
+
+Uso: python benchmarks/load_test.py [--auditorias 8] [--processos 4] [--por-banco 1] [--paginas 2]
+     python benchmarks/load_test.py --url http://localhost:5001 [--auditorias 8]
+
+Sem --url cada processo sobe o app com o test client do Flask; os jobs são criados por um
+processo e acompanhados/baixados por qualquer um. Com --url as requisições vão para um servidor
+já rodando (ex.: gunicorn -w 4 app:app). Cada saída é comparada com a de uma execução serial do
+mesmo conjunto: qualquer marcação trocada entre auditorias aparece como divergência.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pymupdf
+import synthetic
+import telemetry
+
+# Só avisos e erros, em todos os processos (o app é importado depois)
+telemetry.configure_logging('WARNING')
+
+# Nome igual em todas as auditorias: é o caso que antes fazia uma sobrescrever a outra
+APURACAO_NAME = 'Apuracao.pdf'
+
+
+def highlighted_texts(pdf_bytes):
+    marks = set()
+    with pymupdf.open(stream=pdf_bytes, filetype='pdf') as doc:
+        for page in doc:
+            for annot in page.annots(types=[pymupdf.PDF_ANNOT_HIGHLIGHT]):
+                marks.add((page.number, page.get_textbox(annot.rect).strip()))
+    return sorted(marks)
+
+
+def read_files(manifest):
+    with open(manifest['apuracao'], 'rb') as f:
+        apuracao = f.read()
+    extratos = []
+    for st in manifest['extratos']:
+        with open(st['arquivo'], 'rb') as f:
+            extratos.append((os.path.basename(st['arquivo']), f.read()))
+    return apuracao, extratos
+
+
+# --- CLIENTE: test client do Flask (um app por processo) ---
+_client = None
+
+
+def _init_worker(work_dir):
+    global _client
+    os.chdir(work_dir)
+    os.environ.setdefault('EXTRACTION_WORKERS', '1')
+    import app
+    _client = app.app.test_client()
+
+
+def _submit_local(manifest):
+    import io
+    apuracao, extratos = read_files(manifest)
+    data = {'apuracao_pdf': (io.BytesIO(apuracao), APURACAO_NAME),
+            'extratos_pdfs': [(io.BytesIO(content), name) for name, content in extratos]}
+    response = _client.post('/jobs', data=data, content_type='multipart/form-data')
+    return os.getpid(), response.get_json()['id']
+
+
+def _fetch_local(job_id, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = _client.get(f'/jobs/{job_id}').get_json()
+        if job['status'] in ('done', 'error'): break
+        time.sleep(0.2)
+    else:
+        return os.getpid(), 'timeout', None
+    if job['status'] == 'error': return os.getpid(), 'error', job['error']
+    return os.getpid(), 'done', _client.get(f'/jobs/{job_id}/result').data
+
+
+# --- CLIENTE: HTTP contra um servidor rodando ---
+def _multipart(fields):
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for field, (filename, content) in fields:
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                 f'Content-Type: application/pdf\r\n\r\n').encode()
+        body += content + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode()
+    return bytes(body), f'multipart/form-data; boundary={boundary}'
+
+
+def _submit_http(url, manifest):
+    apuracao, extratos = read_files(manifest)
+    fields = [('apuracao_pdf', (APURACAO_NAME, apuracao))] + [('extratos_pdfs', e) for e in extratos]
+    body, content_type = _multipart(fields)
+    req = urllib.request.Request(f'{url}/jobs', data=body, headers={'Content-Type': content_type})
+    with urllib.request.urlopen(req) as response:
+        return None, json.load(response)['id']
+
+
+def _fetch_http(url, job_id, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with urllib.request.urlopen(f'{url}/jobs/{job_id}') as response:
+            job = json.load(response)
+        if job['status'] in ('done', 'error'): break
+        time.sleep(0.2)
+    else:
+        return None, 'timeout', None
+    if job['status'] == 'error': return None, 'error', job['error']
+    with urllib.request.urlopen(f'{url}/jobs/{job_id}/result') as response:
+        return None, 'done', response.read()
+
+
+# --- REFERÊNCIA ---
+def reference_outputs(manifests):
+    """Marcações de cada conjunto numa execução serial, sem concorrência."""
+    os.environ.setdefault('EXTRACTION_WORKERS', '1')
+    import app
+    import blob_store
+    app.app.config['EXTRACTION_WORKERS'] = 1
+    references = []
+    for i, manifest in enumerate(manifests):
+        started = [app.submit_extraction(st['arquivo']) for st in manifest['extratos']]
+        app.run_audit(manifest['apuracao'], started, f'referencia/{i}')
+        with open(blob_store.resolve(f'referencia/{i}')[1], 'rb') as f:
+            references.append(highlighted_texts(f.read()))
+    return references
+
+
+def run(args):
+    tmp_dir = tempfile.mkdtemp(prefix='carga_corretor_')
+    try:
+        # Estado compartilhado entre os processos: jobs, cache e arquivos no mesmo diretório
+        os.environ['JOB_STORE_PATH'] = os.path.join(tmp_dir, 'cache',
+                                                    'jobs.sqlite3' if args.store == 'sqlite' else 'jobs')
+        os.environ['JOB_STORE'] = args.store
+        os.environ['EXTRACTION_CACHE_PATH'] = os.path.join(tmp_dir, 'cache', 'extracao.sqlite3')
+        # Cada auditoria do teste marca do zero: a reauditoria copiaria a saída da referência
+        os.environ['AUDIT_STATE_PATH'] = os.path.join(tmp_dir, 'cache', 'auditorias.sqlite3')
+        os.environ['INCREMENTAL_AUDIT'] = '0'
+        os.environ['BLOB_STORE_PATH'] = os.path.join(tmp_dir, 'store')
+
+        manifests = [synthetic.generate(os.path.join(tmp_dir, 'dados', str(i)), args.por_banco, args.paginas,
+                                        seed=args.seed + i, raster=False)
+                     for i in range(args.auditorias)]
+        references = reference_outputs(manifests)
+
+        start = time.perf_counter()
+        if args.url:
+            with ThreadPoolExecutor(max_workers=args.auditorias) as pool:
+                submitted = list(pool.map(lambda m: _submit_http(args.url, m), manifests))
+                fetched = list(pool.map(lambda s: _fetch_http(args.url, s[1], args.timeout), submitted))
+        else:
+            server_dir = os.path.join(tmp_dir, 'servidor')
+            os.makedirs(server_dir)
+            # spawn: um processo criado por fork herdaria o pool de extração já aberto pela referência
+            with ProcessPoolExecutor(max_workers=args.processos, initializer=_init_worker, initargs=(server_dir,),
+                                     mp_context=multiprocessing.get_context('spawn')) as pool:
+                submitted = list(pool.map(_submit_local, manifests))
+                # Acompanhamento e download em ordem invertida: em geral caem em outro processo
+                job_ids = [job_id for _, job_id in submitted]
+                fetched = list(pool.map(_fetch_local, job_ids[::-1], [args.timeout] * len(job_ids)))[::-1]
+        elapsed = time.perf_counter() - start
+
+        failures = []
+        cross_process = 0
+        for i, ((submit_pid, job_id), (fetch_pid, status, payload)) in enumerate(zip(submitted, fetched)):
+            if submit_pid != fetch_pid: cross_process += 1
+            if status != 'done':
+                failures.append(f"auditoria {i} ({job_id}): {status} {payload or ''}")
+            elif highlighted_texts(payload) != references[i]:
+                failures.append(f"auditoria {i} ({job_id}): marcações diferentes da execução serial")
+
+        print(f"{args.auditorias} auditorias em {elapsed:.1f} s ({args.auditorias / elapsed:.2f}/s)")
+        if not args.url:
+            print(f"{cross_process} acompanhadas por um processo diferente do que recebeu o upload")
+        return failures
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--auditorias', type=int, default=8)
+    parser.add_argument('--processos', type=int, default=4)
+    parser.add_argument('--por-banco', type=int, default=1)
+    parser.add_argument('--paginas', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--store', choices=['sqlite', 'filesystem'], default='sqlite')
+    parser.add_argument('--url', help='servidor já rodando (ex.: http://localhost:5001)')
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    failures = run(args)
+    if failures:
+        print("\nFALHAS:")
+        for failure in failures: print(f"  - {failure}")
+        sys.exit(1)
+    print("Todas as saídas conferem com a execução serial.")
@@ -0,0 +1,244 @@
+"""
+Benchmark das etapas do corretor sobre o conjunto sintético de benchmarks/synthetic.py.
+
+Uso: python benchmarks/run.py [--por-banco 3] [--paginas 3] [--repeticoes 3] [--ocr]
+                              [--baseline benchmarks/baseline.json] [--atualizar-baseline]
+                              [--paginas-memoria 500] [--teto-memoria-mb 40]
+
+Para cada etapa reporta vazão, latência p50/p95 e o recall dos valores plantados, e compara
+com o baseline salvo: sai com código 1 se o p95 piorar além da tolerância ou se o recall cair.
+O baseline versionado (benchmarks/baseline.json) só tem o recall, que não depende da máquina: a
+queda de recall falha em qualquer checkout. Para comparar também o p95, gere um com
+--atualizar-baseline na máquina de referência (etapas sem p95 no baseline não comparam tempo).
+
+Também extrai um extrato sintético grande (--paginas-memoria) num processo separado e falha se o
+pico de memória (ru_maxrss) crescer mais que --teto-memoria-mb: a extração tem que processar
+página a página sem acumular o documento. --paginas-memoria 0 pula essa verificação.
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import resource
+import tempfile
+import multiprocessing
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pymupdf
+import synthetic
+import telemetry
+
+# Só avisos e erros: os logs por arquivo do pipeline não entram na medição
+telemetry.configure_logging('WARNING')
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values: return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct))]
+
+
+def timed(fn, *args):
+    # Silencia os prints do main.py para não medir o terminal
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+    return result, elapsed
+
+
+def summarize(timings, found, planted):
+    timings_ms = sorted(t * 1000 for t in timings)
+    total = sum(timings)
+    return {
+        'itens': len(timings),
+        'vazao_por_s': len(timings) / total if total else 0.0,
+        'p50_ms': percentile(timings_ms, 0.50),
+        'p95_ms': percentile(timings_ms, 0.95),
+        'recall': found / planted if planted else 1.0,
+    }
+
+
+# --- ETAPAS ---
+def stage_app_extraction(statements, repeats, key):
+    import app
+    import extraction_cache
+    timings, found, planted, results = [], 0, 0, []
+    for _ in range(repeats):
+        results = []
+        for st in statements:
+            extraction_cache.invalidate()  # cada medição precisa extrair de verdade
+            data, elapsed = timed(app.extract_advanced_data, st[key])
+            timings.append(elapsed)
+            results.append(data)
+    for st, data in zip(statements, results):
+        planted += len(st['valores'])
+        found += len(set(st['valores']) & set(data['valores']))
+    return summarize(timings, found, planted), results
+
+
+def stage_highlight(apuracao, extracted, repeats, tmp_dir, statements):
+    import app
+    out = os.path.join(tmp_dir, 'Correcao_bench.pdf')
+    timings = []
+    for _ in range(repeats):
+        _, elapsed = timed(app.highlight_audit_file, apuracao, out, extracted)
+        timings.append(elapsed)
+
+    highlighted = set()
+    with pymupdf.open(out) as doc:
+        for page in doc:
+            for annot in page.annots(types=[pymupdf.PDF_ANNOT_HIGHLIGHT]):
+                highlighted.add(page.get_textbox(annot.rect).strip())
+    planted = {v for st in statements for v in st['valores']}
+    return summarize(timings, len(planted & highlighted), len(planted))
+
+
+def stage_main_extraction(statements, repeats):
+    import main
+    supported = [st for st in statements if st['suportado_main']]
+    timings, results = [], []
+    for _ in range(repeats):
+        results = []
+        for st in supported:
+            values, elapsed = timed(main.extract_values_from_pdf, st['arquivo'])
+            timings.append(elapsed)
+            results.append(values)
+    planted = sum(len(st['valores']) for st in supported)
+    found = sum(len(set(st['valores']) & set(values)) for st, values in zip(supported, results))
+    return summarize(timings, found, planted)
+
+
+def _measure_memory(target, pdf_path, cache_path, queue):
+    # Roda num processo novo: o pico medido é só o da extração (os imports vêm antes da medição)
+    import app
+    import main
+    import extraction_cache
+    extraction_cache.CACHE_PATH = cache_path
+    extract = app.extract_advanced_data if target == 'app' else main.extract_values_from_pdf
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with contextlib.redirect_stdout(io.StringIO()):
+        extract(pdf_path)
+    queue.put((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss) / 1024)
+
+
+def stage_memory(pages, tmp_dir):
+    """Pico de memória (MB) ao extrair um extrato de `pages` páginas, no app e no main.py."""
+    profile = synthetic.BANK_PROFILES['caixa']
+    lines = [line.format(cnpj='00.000.000/0001-00', v0='1,00', v1='2,00', v2='3,00', v3='4,00')
+             for line in profile['linhas']]
+    pdf_path = os.path.join(tmp_dir, 'extrato_grande.pdf')
+    synthetic.write_statement(pdf_path, lines, pages - 1, random.Random(0))
+
+    peaks = {}
+    for target in ('app', 'main'):
+        queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=_measure_memory, args=(
+            target, pdf_path, os.path.join(tmp_dir, f'cache_memoria_{target}.sqlite3'), queue))
+        proc.start()
+        peaks[target] = queue.get()
+        proc.join()
+    return peaks
+
+
+def ocr_available():
+    import ocr_engine
+    return ocr_engine.tesserocr is not None or shutil.which('tesseract') is not None
+
+
+# --- BASELINE ---
+def compare(results, baseline, tolerance):
+    failures = []
+    for stage, current in results.items():
+        reference = baseline.get(stage)
+        if not reference: continue
+        if 'p95_ms' in reference and current['p95_ms'] > reference['p95_ms'] * (1 + tolerance):
+            failures.append(f"{stage}: p95 {current['p95_ms']:.1f} ms > baseline {reference['p95_ms']:.1f} ms "
+                            f"(+{tolerance:.0%})")
+        if current['recall'] < reference['recall']:
+            failures.append(f"{stage}: recall {current['recall']:.3f} < baseline {reference['recall']:.3f}")
+    return failures
+
+
+def run(args):
+    tmp_dir = tempfile.mkdtemp(prefix='bench_corretor_')
+    try:
+        import extraction_cache
+        extraction_cache.CACHE_PATH = os.path.join(tmp_dir, 'cache.sqlite3')
+
+        with_ocr = args.ocr and ocr_available()
+        if args.ocr and not with_ocr:
+            print("Tesseract não encontrado: a etapa de OCR será ignorada.")
+        manifest = synthetic.generate(os.path.join(tmp_dir, 'dados'), args.por_banco, args.paginas,
+                                      args.seed, raster=with_ocr)
+        statements = manifest['extratos']
+        print(f"Conjunto: {len(statements)} extratos ({args.paginas} páginas cada), "
+              f"{args.repeticoes} repetições\n")
+
+        results = {}
+        results['app_extracao_texto'], extracted = stage_app_extraction(statements, args.repeticoes, 'arquivo')
+        if with_ocr:
+            results['app_extracao_ocr'], _ = stage_app_extraction(statements, 1, 'arquivo_imagem')
+        results['app_marcacao'] = stage_highlight(manifest['apuracao'], extracted, args.repeticoes,
+                                                  tmp_dir, statements)
+        results['main_extracao'] = stage_main_extraction(statements, args.repeticoes)
+
+        memory = stage_memory(args.paginas_memoria, tmp_dir) if args.paginas_memoria else {}
+        return results, memory
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--por-banco', type=int, default=3)
+    parser.add_argument('--paginas', type=int, default=3)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--ocr', action='store_true', help='inclui os extratos rasterizados (precisa do tesseract)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--atualizar-baseline', action='store_true')
+    parser.add_argument('--tolerancia', type=float, default=0.25, help='piora aceita no p95 (0.25 = 25%%)')
+    parser.add_argument('--paginas-memoria', type=int, default=500)
+    parser.add_argument('--teto-memoria-mb', type=float, default=40)
+    args = parser.parse_args()
+
+    results, memory = run(args)
+
+    print(f"{'etapa':<22}{'itens':>7}{'itens/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'recall':>9}")
+    for stage, r in results.items():
+        print(f"{stage:<22}{r['itens']:>7}{r['vazao_por_s']:>10.1f}{r['p50_ms']:>10.1f}"
+              f"{r['p95_ms']:>10.1f}{r['recall']:>9.3f}")
+
+    failures = []
+    if memory:
+        print(f"\nPico de memória num extrato de {args.paginas_memoria} páginas (teto {args.teto_memoria_mb:.0f} MB):")
+        for target, peak_mb in memory.items():
+            print(f"  {target:<6} +{peak_mb:.1f} MB")
+            if peak_mb > args.teto_memoria_mb:
+                failures.append(f"memória {target}: +{peak_mb:.1f} MB > teto {args.teto_memoria_mb:.0f} MB")
+
+    if args.atualizar_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline salvo em '{args.baseline}'.")
+    elif not os.path.exists(args.baseline):
+        print(f"\nSem baseline em '{args.baseline}'; nada a comparar.")
+    else:
+        with open(args.baseline, encoding='utf-8') as f:
+            failures += compare(results, json.load(f), args.tolerancia)
+
+    if failures:
+        print("\nREGRESSÕES:")
+        for failure in failures: print(f"  - {failure}")
+        sys.exit(1)
+    print("\nSem regressões.")
@@ -0,0 +1,212 @@
+"""
+Gera extratos sintéticos de cada banco (com camada de texto e rasterizados) e uma apuração
+correspondente, com valores e CNPJs conhecidos, para os benchmarks.
+
+Uso: python benchmarks/synthetic.py pasta_destino [--por-banco 3] [--paginas 3] [--seed 42]
+
+Escreve também manifesto.json com os valores plantados em cada arquivo.
+"""
+import os
+import json
+import random
+import argparse
+
+import pymupdf
+
+# Linhas de cada extrato. {v0}..{v3} são os valores plantados e {cnpj} o CNPJ do fundo.
+# Os textos seguem o que os perfis de bank_profiles.py esperam (app.py e main.py).
+BANK_PROFILES = {
+    'itau': {
+        'banco': '341',
+        'main': True,
+        'linhas': [
+            'ITAÚ UNIBANCO S.A. - Extrato Mensal de Aplicações',
+            'CNPJ {cnpj} Taxa adm 0,50%',
+            'SALDO BRUTO ATUAL 100,00 {v0}',
+            'APLICACOES {v1}',
+            'RESGATES {v2}',
+            'RENDIMENTO BRUTO NO MES {v3}',
+        ],
+    },
+    'caixa': {
+        'banco': '104',
+        'main': True,
+        'linhas': [
+            'CAIXA ECONOMICA FEDERAL - Extrato de Aplicação',
+            'CNPJ do fundo: {cnpj}',
+            'Aplicações {v0}C',
+            'Resgates {v1}D',
+            'Rendimento Bruto no Mês {v2}C',
+            'Saldo Bruto Final R$ {v3}',
+        ],
+    },
+    'bb': {
+        'banco': '1',
+        'main': True,
+        'linhas': [
+            'BANCO DO BRASIL S.A. - Consulta de Aplicações',
+            'CNPJ {cnpj}',
+            'Resumo do mês',
+            'APLICAÇÕES (+) {v0}',
+            'RESGATES (-) {v1}',
+            'RENDIMENTO BRUTO (+) {v2}',
+            'SALDO ATUAL = {v3}',
+            'Transação efetuada com sucesso',
+        ],
+    },
+    'bradesco': {
+        'banco': '237',
+        'main': True,
+        'linhas': [
+            'BRADESCO - Extrato de Investimentos',
+            'CNPJ {cnpj}',
+            'Saldo em 31/01/2024 {v0}',
+            'Rendimento Bruto {v1}',
+            'Aplicações no Período {v2}',
+            'Resgates no Período 0,00 {v3}',
+        ],
+    },
+    'safra': {
+        'banco': '41',
+        'main': False,  # main.py não tem regras para o Safra
+        'linhas': [
+            'BANCO SAFRA S.A. - Posição de Investimentos',
+            'CNPJ {cnpj}',
+            'Saldo Líquido {v0}',
+            'Total Aplicado {v1}',
+            'Valor Resgatado {v2}',
+            'Saldo Final {v3}',
+        ],
+    },
+    'xp': {
+        'banco': '11',
+        'main': True,
+        'linhas': [
+            'XP INVESTIMENTOS - Extrato Mensal',
+            'CNPJ {cnpj}',
+            'Saldo bruto atual: R$ {v0}',
+            'Total aplicado: R$ {v1}',
+            'Total resgatado: R$ {v2}',
+            'Rendimento Bruto {v3}',
+        ],
+    },
+}
+
+FILLER_LINE = '{data} MOVIMENTACAO DIVERSA REF {ref} {valor}'
+LINE_HEIGHT = 14
+RASTER_DPI = 150
+
+
+def format_brl(cents):
+    integer, decimal = divmod(cents, 100)
+    return f"{integer:,}".replace(',', '.') + f",{decimal:02d}"
+
+
+def random_cnpj(rng):
+    d = ''.join(str(rng.randint(0, 9)) for _ in range(14))
+    return f"{d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}"
+
+
+def write_statement(path, lines, filler_pages, rng):
+    doc = pymupdf.open()
+    page = doc.new_page()
+    y = 60
+    for line in lines:
+        page.insert_text((50, y), line, fontsize=10)
+        y += LINE_HEIGHT
+    for _ in range(filler_pages):
+        page = doc.new_page()
+        for row in range(45):
+            text = FILLER_LINE.format(data=f"{rng.randint(1, 28):02d}/01/2024", ref=rng.randint(1000, 9999),
+                                      valor=format_brl(rng.randint(100, 99999)))
+            page.insert_text((50, 60 + row * LINE_HEIGHT), text, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def rasterize(src_path, dst_path, dpi=RASTER_DPI):
+    """Cópia só-imagem do PDF (sem camada de texto), como um extrato escaneado."""
+    with pymupdf.open(src_path) as src, pymupdf.open() as dst:
+        for page in src:
+            pix = page.get_pixmap(dpi=dpi, colorspace=pymupdf.csGRAY)
+            new_page = dst.new_page(width=page.rect.width, height=page.rect.height)
+            new_page.insert_image(new_page.rect, pixmap=pix)
+        dst.save(dst_path, deflate=True)
+
+
+def write_apuracao(path, statements):
+    # Uma linha por extrato: conta (x < 200), nome do fundo (x < 300) e os valores à direita
+    doc = pymupdf.open()
+    rows_per_page = 50
+    for i, st in enumerate(statements):
+        if i % rows_per_page == 0:
+            page = doc.new_page()
+        y = 60 + (i % rows_per_page) * LINE_HEIGHT
+        page.insert_text((30, y), f"C/C {st['conta']}", fontsize=8)
+        page.insert_text((110, y), st['nome_fundo'], fontsize=8)
+        for col, value in enumerate(st['valores']):
+            page.insert_text((300 + col * 70, y), value, fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def generate(out_dir, per_bank=3, pages=3, seed=42, raster=True):
+    """Gera o conjunto e retorna o manifesto (também salvo em out_dir/manifesto.json)."""
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    statements = []
+    accounts = set()
+
+    for profile_name, profile in BANK_PROFILES.items():
+        for n in range(per_bank):
+            while True:
+                conta = f"{rng.randint(10000, 99999)}-{rng.randint(0, 9)}"
+                if conta not in accounts: break
+            accounts.add(conta)
+            cnpj = random_cnpj(rng)
+            values = [format_brl(rng.randint(100, 999999999)) for _ in range(4)]
+            lines = [line.format(cnpj=cnpj, **{f"v{i}": v for i, v in enumerate(values)})
+                     for line in profile['linhas']]
+
+            base = f"{profile_name}_{n:03d}_{conta}"
+            path = os.path.join(out_dir, base + '.pdf')
+            write_statement(path, lines, max(0, pages - 1), rng)
+            raster_path = None
+            if raster:
+                raster_dir = os.path.join(out_dir, 'imagem')
+                os.makedirs(raster_dir, exist_ok=True)
+                raster_path = os.path.join(raster_dir, base + '.pdf')
+                rasterize(path, raster_path)
+
+            statements.append({
+                'perfil': profile_name,
+                'banco': profile['banco'],
+                'suportado_main': profile['main'],
+                'arquivo': path,
+                'arquivo_imagem': raster_path,
+                'conta': conta,
+                'cnpj': cnpj,
+                'nome_fundo': f"FUNDO SINTETICO {profile_name.upper()} {n:03d}",
+                'valores': values,
+            })
+
+    apuracao_path = os.path.join(out_dir, 'Apuracao.pdf')
+    write_apuracao(apuracao_path, statements)
+
+    manifest = {'apuracao': apuracao_path, 'extratos': statements}
+    with open(os.path.join(out_dir, 'manifesto.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('destino')
+    parser.add_argument('--por-banco', type=int, default=3)
+    parser.add_argument('--paginas', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sem-imagem', action='store_true', help='não gera as versões rasterizadas')
+    args = parser.parse_args()
+
+    manifest = generate(args.destino, args.por_banco, args.paginas, args.seed, raster=not args.sem_imagem)
+    print(f"{len(manifest['extratos'])} extratos e a apuração gerados em '{args.destino}'.")
@@ -0,0 +1,184 @@
+import os
+import time
+import shutil
+import sqlite3
+import logging
+import tempfile
+import threading
+import extraction_cache
+
+# Armazenamento endereçado por conteúdo dos uploads gravados em disco e das apurações marcadas:
+# cada arquivo fica em objects/<2 primeiros>/<sha256>, uma vez só, não importa quantas vezes foi
+# enviado ou gerado. Os downloads chegam por nomes ('<job>/<arquivo>') ligados a um hash.
+#
+# Os metadados (tamanho, tipo, último acesso) ficam num SQLite ao lado. Uma thread de fundo remove
+# os arquivos sem acesso há mais de BLOB_STORE_MAX_AGE_DAYS e, se o total passar de
+# BLOB_STORE_MAX_BYTES, os acessados há mais tempo (LRU). Nada acessado nos últimos
+# BLOB_EVICTION_GRACE segundos é removido: protege as auditorias em andamento.
+STORE_PATH = os.path.abspath(os.environ.get('BLOB_STORE_PATH', 'store'))
+STORE_MAX_BYTES = int(os.environ.get('BLOB_STORE_MAX_BYTES', 10 * 1024 ** 3))
+STORE_MAX_AGE = float(os.environ.get('BLOB_STORE_MAX_AGE_DAYS', 30)) * 24 * 3600
+EVICTION_INTERVAL = float(os.environ.get('BLOB_EVICTION_INTERVAL', 600))
+EVICTION_GRACE = float(os.environ.get('BLOB_EVICTION_GRACE', 3600))
+
+OBJECTS_DIR = os.path.join(STORE_PATH, 'objects')
+TMP_DIR = os.path.join(STORE_PATH, 'tmp')
+DB_PATH = os.path.join(STORE_PATH, 'blobs.sqlite3')
+
+log = logging.getLogger('corretor.armazenamento')
+
+_eviction_thread = None
+_eviction_lock = threading.Lock()
+
+
+def _connect():
+    os.makedirs(STORE_PATH, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            tamanho INTEGER NOT NULL,
+            tipo TEXT NOT NULL,
+            criado REAL NOT NULL,
+            ultimo_acesso REAL NOT NULL
+        )
+    """)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_blobs_acesso ON blobs (ultimo_acesso)')
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS nomes (
+            nome TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            criado REAL NOT NULL
+        )
+    """)
+    return conn
+
+
+def object_path(content_hash):
+    return os.path.join(OBJECTS_DIR, content_hash[:2], content_hash)
+
+
+def temp_path(suffix=''):
+    """Arquivo temporário dentro do armazenamento (mesmo disco: put_file só o renomeia)."""
+    os.makedirs(TMP_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=TMP_DIR)
+    os.close(fd)
+    return path
+
+
+def put_file(path, kind, content_hash=None):
+    """
+    Move o arquivo `path` para o armazenamento e retorna o hash. Se o conteúdo já estava lá, o
+    arquivo recebido é descartado e o existente ganha um acesso.
+    """
+    content_hash = content_hash or extraction_cache.file_sha256(path)
+    size = os.path.getsize(path)
+    target = object_path(content_hash)
+    now = time.time()
+    conn = _connect()
+    try:
+        # A transação segura a remoção de fundo: ela apaga os arquivos dentro da própria transação
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT INTO blobs VALUES (?, ?, ?, ?, ?) '
+                         'ON CONFLICT(hash) DO UPDATE SET ultimo_acesso = excluded.ultimo_acesso',
+                         (content_hash, size, kind, now, now))
+            if os.path.exists(target):
+                os.remove(path)
+                log.info(f"Arquivo repetido ({content_hash[:12]}); mantida a cópia existente")
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+    return content_hash
+
+
+def link(name, content_hash):
+    """Associa um nome de download ao conteúdo."""
+    conn = _connect()
+    try:
+        conn.execute('INSERT OR REPLACE INTO nomes VALUES (?, ?, ?)', (name, content_hash, time.time()))
+    finally:
+        conn.close()
+
+
+def resolve(name):
+    """(hash, caminho) do nome, ou None se não existe ou o conteúdo já foi removido. Conta como acesso."""
+    conn = _connect()
+    try:
+        row = conn.execute('SELECT hash FROM nomes WHERE nome = ?', (name,)).fetchone()
+        if row is None: return None
+        content_hash = row[0]
+        updated = conn.execute('UPDATE blobs SET ultimo_acesso = ? WHERE hash = ?',
+                               (time.time(), content_hash)).rowcount
+    finally:
+        conn.close()
+    path = object_path(content_hash)
+    if not updated or not os.path.exists(path): return None
+    return content_hash, path
+
+
+def evict(now=None):
+    """Remove o que passou da idade máxima e, pelo LRU, o que excede o tamanho máximo. Retorna quantos saíram."""
+    now = now or time.time()
+    conn = _connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute('SELECT hash, tamanho, ultimo_acesso FROM blobs ORDER BY ultimo_acesso').fetchall()
+            total = sum(size for _, size, _ in rows)
+            removed = []
+            for content_hash, size, last_access in rows:
+                if last_access > now - EVICTION_GRACE: break
+                if last_access > now - STORE_MAX_AGE and total <= STORE_MAX_BYTES: break
+                removed.append(content_hash)
+                total -= size
+            for content_hash in removed:
+                conn.execute('DELETE FROM blobs WHERE hash = ?', (content_hash,))
+                conn.execute('DELETE FROM nomes WHERE hash = ?', (content_hash,))
+                try:
+                    os.remove(object_path(content_hash))
+                except FileNotFoundError:
+                    pass
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+
+    # Temporários esquecidos por um processo que caiu no meio de um upload
+    if os.path.isdir(TMP_DIR):
+        for entry in os.scandir(TMP_DIR):
+            try:
+                if entry.stat().st_mtime < now - EVICTION_GRACE: os.remove(entry.path)
+            except OSError:
+                pass
+
+    if removed:
+        log.info(f"{len(removed)} arquivos removidos do armazenamento ({total} bytes restantes)")
+    return len(removed)
+
+
+def start_eviction():
+    """Inicia (uma vez por processo) a thread que roda evict() a cada EVICTION_INTERVAL segundos."""
+    global _eviction_thread
+
+    def loop():
+        while True:
+            try:
+                evict()
+            except Exception as e:
+                log.warning(f"Falha na remoção de arquivos antigos: {e}")
+            time.sleep(EVICTION_INTERVAL)
+
+    with _eviction_lock:
+        if _eviction_thread is None:
+            _eviction_thread = threading.Thread(target=loop, name='blob-eviction', daemon=True)
+            _eviction_thread.start()
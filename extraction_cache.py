@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+
+# Cache em disco dos resultados de extract_advanced_data, endereçado pelo hash do conteúdo do PDF
+CACHE_PATH = os.environ.get('EXTRACTION_CACHE_PATH', os.path.join('cache', 'extracao.sqlite3'))
+CACHE_MAX_BYTES = int(os.environ.get('EXTRACTION_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+log = logging.getLogger('corretor.cache')
+
+
+def file_sha256(pdf_path):
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _connect():
+    os.makedirs(os.path.dirname(CACHE_PATH) or '.', exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS extracoes (
+            hash TEXT NOT NULL,
+            versao TEXT NOT NULL,
+            dados TEXT NOT NULL,
+            tamanho INTEGER NOT NULL,
+            ultimo_acesso REAL NOT NULL,
+            PRIMARY KEY (hash, versao)
+        )
+    """)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_extracoes_acesso ON extracoes (ultimo_acesso)')
+    return conn
+
+
+def get(content_hash, version):
+    """
+    Retorna o dict salvo para (hash, versão do extrator) ou None.
+    Um acerto atualiza o horário de acesso usado pela remoção LRU.
+    """
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                row = conn.execute('SELECT dados FROM extracoes WHERE hash = ? AND versao = ?',
+                                   (content_hash, version)).fetchone()
+                if row is None: return None
+                conn.execute('UPDATE extracoes SET ultimo_acesso = ? WHERE hash = ? AND versao = ?',
+                             (time.time(), content_hash, version))
+            return json.loads(row[0])
+        finally:
+            conn.close()
+    except Exception as e:
+        log.warning(f"Falha ao ler o cache: {e}")
+        return None
+
+
+def put(content_hash, version, data):
+    try:
+        payload = json.dumps(data, ensure_ascii=False)
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO extracoes VALUES (?, ?, ?, ?, ?)',
+                             (content_hash, version, payload, len(payload.encode('utf-8')), time.time()))
+                _evict(conn)
+        finally:
+            conn.close()
+    except Exception as e:
+        log.warning(f"Falha ao gravar no cache: {e}")
+
+
+def _evict(conn):
+    # Remove as entradas acessadas há mais tempo até o total caber em CACHE_MAX_BYTES
+    total = conn.execute('SELECT COALESCE(SUM(tamanho), 0) FROM extracoes').fetchone()[0]
+    if total <= CACHE_MAX_BYTES: return
+    for content_hash, version, size in conn.execute(
+            'SELECT hash, versao, tamanho FROM extracoes ORDER BY ultimo_acesso').fetchall():
+        conn.execute('DELETE FROM extracoes WHERE hash = ? AND versao = ?', (content_hash, version))
+        total -= size
+        if total <= CACHE_MAX_BYTES: break
+
+
+def invalidate(content_hash=None):
+    """Remove as entradas de um hash (todas as versões) ou o cache inteiro. Retorna quantas saíram."""
+    conn = _connect()
+    try:
+        with conn:
+            if content_hash:
+                cur = conn.execute('DELETE FROM extracoes WHERE hash = ?', (content_hash,))
+            else:
+                cur = conn.execute('DELETE FROM extracoes')
+            return cur.rowcount
+    finally:
+        conn.close()
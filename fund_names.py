@@ -0,0 +1,257 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import logging
+import datetime
+import threading
+from mysql.connector import errors, pooling
+import telemetry
+
+# Resolução CNPJ -> nome do fundo (tabela gerador_fundos do smiconsult)
+DB_CONFIG = {
+    'user': 'augusto',
+    'password': 'somma13',
+    'host': 'smiconsult.com.br',
+    'database': 'smiconsult'
+}
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 4))
+# Tempo máximo (s) esperando uma conexão livre quando todas as do pool estão em uso
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+# Tempo (s) que um nome resolvido (ou um CNPJ inexistente) fica no cache do processo
+FUND_NAME_TTL = int(os.environ.get('FUND_NAME_TTL', 3600))
+# Quantidade máxima de CNPJs por consulta IN (...)
+DB_BATCH_SIZE = 200
+# Cópia local e indexada de gerador_fundos (python fund_names.py sync); consultada antes do MySQL
+LOCAL_INDEX_PATH = os.environ.get('FUND_INDEX_PATH', os.path.join('cache', 'fundos.sqlite3'))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+_name_cache = {}  # cnpj (14 dígitos) -> (nome ou None, expira_em)
+_name_cache_lock = threading.Lock()
+
+_local = threading.local()  # uma conexão SQLite de leitura por thread
+
+log = logging.getLogger('corretor.fundos')
+
+
+# --- DB CONNECTION ---
+def get_db_connection():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pooling.MySQLConnectionPool(pool_name='smiconsult', pool_size=DB_POOL_SIZE,
+                                                pool_reset_session=True, **DB_CONFIG)
+    # O pool não espera por uma conexão livre: com todas em uso (auditorias simultâneas além de
+    # DB_POOL_SIZE) get_connection falha na hora, então tenta de novo até DB_POOL_TIMEOUT.
+    # close() na conexão devolve ela ao pool
+    deadline = time.monotonic() + DB_POOL_TIMEOUT
+    delay = 0.01
+    while True:
+        try:
+            return _pool.get_connection()
+        except errors.PoolError:
+            if time.monotonic() >= deadline: raise
+            telemetry.incr('db_pool_waits')
+            time.sleep(min(delay, max(0, deadline - time.monotonic())))
+            delay = min(delay * 2, 0.25)
+
+
+# --- HELPERS ---
+def normalize_cnpj(cnpj_raw):
+    if not cnpj_raw: return None
+    digits = re.sub(r'[^\d]', '', cnpj_raw)
+    if not digits or len(digits) > 14: return None
+    return digits.zfill(14)
+
+
+def format_cnpj(digits):
+    return f"{digits[:2]}.{digits[2:5]}.{digits[5:8]}/{digits[8:12]}-{digits[12:]}"
+
+
+def _query_fund_names(cnpjs):
+    """
+    Busca os nomes de vários CNPJs (já normalizados) em uma consulta parametrizada por lote.
+    A coluna cnpj_fundo pode estar formatada ou só com dígitos, então as duas formas vão no IN.
+    Para cada CNPJ vale o registro com o periodo_fundo mais recente.
+    """
+    found = {}
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        for start in range(0, len(cnpjs), DB_BATCH_SIZE):
+            batch = cnpjs[start:start + DB_BATCH_SIZE]
+            params = [form for c in batch for form in (c, format_cnpj(c))]
+            placeholders = ', '.join(['%s'] * len(params))
+            cursor.execute(f"""
+                SELECT cnpj_fundo, nome_fundo FROM gerador_fundos
+                WHERE cnpj_fundo IN ({placeholders})
+                ORDER BY periodo_fundo DESC
+            """, params)
+            for cnpj_fundo, nome_fundo in cursor.fetchall():
+                key = normalize_cnpj(cnpj_fundo)
+                if key and key not in found:
+                    found[key] = nome_fundo
+        cursor.close()
+    finally:
+        conn.close()
+    return found
+
+
+# --- ÍNDICE LOCAL ---
+def _connect_local_index(path=None):
+    path = path or LOCAL_INDEX_PATH
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fundos (
+            cnpj TEXT PRIMARY KEY,
+            nome_fundo TEXT NOT NULL,
+            periodo_fundo
+        ) WITHOUT ROWID
+    """)
+    return conn
+
+
+def _local_index_connection():
+    if not os.path.exists(LOCAL_INDEX_PATH): return None
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = _connect_local_index()
+    return conn
+
+
+def _periodo_value(periodo):
+    # DATE/DATETIME do MySQL viram texto ISO, que ordena corretamente no SQLite
+    if isinstance(periodo, (datetime.date, datetime.datetime)): return periodo.isoformat()
+    return periodo
+
+
+def sync_local_index(source_conn=None, local_path=None, full=False):
+    """
+    Copia gerador_fundos para o índice local, chaveado pelo CNPJ só com dígitos e mantendo
+    o nome do periodo_fundo mais recente. Sem full=True, só lê as linhas a partir do
+    maior periodo_fundo já sincronizado.
+    source_conn pode ser qualquer conexão DB-API com a tabela gerador_fundos (ex.: sqlite3
+    em testes); por padrão usa o MySQL. Retorna o número de linhas lidas da origem.
+    """
+    local_conn = _connect_local_index(local_path)
+    own_source = source_conn is None
+    if own_source:
+        source_conn = get_db_connection()
+    placeholder = '?' if isinstance(source_conn, sqlite3.Connection) else '%s'
+
+    try:
+        watermark = None if full else local_conn.execute('SELECT MAX(periodo_fundo) FROM fundos').fetchone()[0]
+        query = 'SELECT cnpj_fundo, nome_fundo, periodo_fundo FROM gerador_fundos'
+        params = ()
+        if watermark is not None:
+            # >= e não >: linhas novas podem chegar com o mesmo período já sincronizado
+            query += f' WHERE periodo_fundo >= {placeholder}'
+            params = (watermark,)
+        query += ' ORDER BY periodo_fundo'
+
+        cursor = source_conn.cursor()
+        cursor.execute(query, params)
+        total = 0
+        with local_conn:
+            if full:
+                local_conn.execute('DELETE FROM fundos')
+            while True:
+                rows = cursor.fetchmany(5000)
+                if not rows: break
+                batch = []
+                for cnpj_fundo, nome_fundo, periodo_fundo in rows:
+                    cnpj = normalize_cnpj(cnpj_fundo)
+                    if cnpj and nome_fundo:
+                        batch.append((cnpj, nome_fundo, _periodo_value(periodo_fundo)))
+                local_conn.executemany("""
+                    INSERT INTO fundos (cnpj, nome_fundo, periodo_fundo) VALUES (?, ?, ?)
+                    ON CONFLICT (cnpj) DO UPDATE SET
+                        nome_fundo = excluded.nome_fundo, periodo_fundo = excluded.periodo_fundo
+                    WHERE excluded.periodo_fundo >= fundos.periodo_fundo OR fundos.periodo_fundo IS NULL
+                """, batch)
+                total += len(rows)
+        cursor.close()
+        return total
+    finally:
+        local_conn.close()
+        if own_source:
+            source_conn.close()
+
+
+def lookup_local_index(cnpjs):
+    """Busca CNPJs normalizados no índice local. Retorna {cnpj: nome} só para os encontrados."""
+    conn = _local_index_connection()
+    if conn is None or not cnpjs: return {}
+    found = {}
+    for start in range(0, len(cnpjs), DB_BATCH_SIZE):
+        batch = cnpjs[start:start + DB_BATCH_SIZE]
+        placeholders = ', '.join(['?'] * len(batch))
+        found.update(conn.execute(f'SELECT cnpj, nome_fundo FROM fundos WHERE cnpj IN ({placeholders})', batch))
+    return found
+
+
+def resolve_fund_names(cnpjs_raw, failed=None):
+    """
+    Resolve uma coleção de CNPJs (em qualquer formato) de uma vez.
+    Retorna dict {cnpj com 14 dígitos: nome_fundo} apenas para os encontrados.
+    Ordem de consulta: cache do processo, índice local e, só para o que faltar, o MySQL.
+    Os CNPJs já consultados no MySQL dentro do TTL, encontrados ou não, não voltam ao banco.
+    Se o MySQL falhar, os nomes já achados são retornados mesmo assim; `failed` (um set), se
+    informado, recebe os CNPJs que ficaram sem consulta.
+    """
+    now = time.monotonic()
+    names = {}
+    missing = []
+    with _name_cache_lock:
+        for cnpj in {normalize_cnpj(c) for c in cnpjs_raw} - {None}:
+            entry = _name_cache.get(cnpj)
+            if entry and entry[1] > now:
+                if entry[0]: names[cnpj] = entry[0]
+            else:
+                missing.append(cnpj)
+    telemetry.incr('fund_name_cache_hits', len(names))
+
+    if missing:
+        try:
+            local = lookup_local_index(missing)
+        except Exception as e:
+            log.warning(f"Falha ao consultar o índice local de fundos: {e}")
+            local = {}
+        names.update(local)
+        telemetry.incr('fund_index_hits', len(local))
+        missing = [c for c in missing if c not in local]
+
+    if missing:
+        try:
+            telemetry.incr('db_queries')
+            found = _query_fund_names(sorted(missing))
+        except Exception as e:
+            log.error(f"Falha ao buscar nomes para {len(missing)} CNPJs: {e}")
+            if failed is not None: failed.update(missing)
+            return names
+
+        expires = time.monotonic() + FUND_NAME_TTL
+        with _name_cache_lock:
+            for cnpj in missing:
+                _name_cache[cnpj] = (found.get(cnpj), expires)
+        names.update(found)
+
+    return names
+
+
+# --- Sincronização do índice local ---
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != 'sync':
+        print("Uso: python fund_names.py sync [--completo]")
+        sys.exit(1)
+
+    completo = '--completo' in sys.argv[2:]
+    inicio = time.perf_counter()
+    lidas = sync_local_index(full=completo)
+    print(f"Índice local '{LOCAL_INDEX_PATH}' atualizado: {lidas} linhas lidas de gerador_fundos "
+          f"em {time.perf_counter() - inicio:.1f}s ({'completo' if completo else 'incremental'}).")
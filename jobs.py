@@ -0,0 +1,239 @@
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+import contextlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows: o lock entre processos do FileJobStore fica só dentro do processo
+    fcntl = None
+
+# Auditorias assíncronas: o POST devolve um id na hora e o pipeline roda numa thread de fundo.
+# Cada job guarda o progresso por extrato; 'version' aumenta a cada mudança para o SSE/polling.
+#
+# O estado dos jobs fica num armazenamento compartilhado (SQLite por padrão, ou um JSON por job
+# num diretório), para que vários workers do gunicorn ou várias máquinas com o mesmo volume
+# atendam status, eventos e download de um job iniciado em outro processo. O job em si roda no
+# processo que recebeu o upload.
+
+# Quantas auditorias rodam ao mesmo tempo (a extração de cada uma já usa o pool de processos)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Jobs finalizados ficam disponíveis por este tempo (s)
+JOB_RETENTION = int(os.environ.get('JOB_RETENTION', 24 * 3600))
+# Onde o estado dos jobs fica: 'sqlite' (arquivo único) ou 'filesystem' (um JSON por job)
+JOB_STORE = os.environ.get('JOB_STORE', 'sqlite')
+JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH', os.path.join(
+    'cache', 'jobs.sqlite3' if JOB_STORE == 'sqlite' else 'jobs'))
+# Intervalo (s) com que quem espera por um job de outro processo relê o armazenamento
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 0.5))
+
+_JOB_ID = re.compile(r'[0-9a-f]{32}')
+
+_changed = threading.Condition()
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='audit-job')
+
+log = logging.getLogger('corretor.jobs')
+
+
+# --- ARMAZENAMENTO ---
+class SQLiteJobStore:
+    """Jobs numa tabela SQLite (WAL); as atualizações são read-modify-write numa transação exclusiva."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    dados TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    atualizado REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def create(self, job):
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute('INSERT INTO jobs VALUES (?, ?, ?, ?)',
+                         (job['id'], json.dumps(job), job['status'], job['updated_at']))
+
+    def get(self, job_id):
+        with contextlib.closing(self._connect()) as conn:
+            row = conn.execute('SELECT dados FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, job_id, mutate):
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT dados FROM jobs WHERE id = ?', (job_id,)).fetchone()
+                if row is None:
+                    conn.execute('ROLLBACK')
+                    return None
+                job = json.loads(row[0])
+                mutate(job)
+                conn.execute('UPDATE jobs SET dados = ?, status = ?, atualizado = ? WHERE id = ?',
+                             (json.dumps(job), job['status'], job['updated_at'], job_id))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return job
+
+    def purge(self, older_than):
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'error') AND atualizado < ?", (older_than,))
+
+
+class FileJobStore:
+    """Um arquivo JSON por job; gravação atômica (os.replace) e lock de arquivo entre processos."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._thread_lock = threading.Lock()
+
+    def _job_path(self, job_id):
+        return os.path.join(self.path, f"{job_id}.json")
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._thread_lock, open(os.path.join(self.path, '.lock'), 'a') as lock_file:
+            if fcntl: fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl: fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, job):
+        tmp_path = f"{self._job_path(job['id'])}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._job_path(job['id']))
+
+    def create(self, job):
+        with self._locked():
+            self._write(job)
+
+    def get(self, job_id):
+        try:
+            with open(self._job_path(job_id), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def update(self, job_id, mutate):
+        with self._locked():
+            job = self.get(job_id)
+            if job is None: return None
+            mutate(job)
+            self._write(job)
+        return job
+
+    def purge(self, older_than):
+        with self._locked():
+            for name in os.listdir(self.path):
+                if not name.endswith('.json'): continue
+                job = self.get(name[:-len('.json')])
+                if job and job['status'] in ('done', 'error') and job['updated_at'] < older_than:
+                    os.remove(self._job_path(job['id']))
+
+
+STORES = {'sqlite': SQLiteJobStore, 'filesystem': FileJobStore}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = STORES[JOB_STORE](JOB_STORE_PATH)
+        return _store
+
+
+# --- API ---
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+def create_job(statement_names, job_id=None):
+    job_id = job_id or new_job_id()
+    now = time.time()
+    job = {
+        'id': job_id,
+        'status': 'queued',
+        'stage': 'Na fila',
+        'statements': [{'filename': name, 'status': 'pending'} for name in statement_names],
+        'message': None,
+        'error': None,
+        'output_filename': None,
+        'created_at': now,
+        'updated_at': now,
+        'version': 0
+    }
+    store = get_store()
+    store.purge(now - JOB_RETENTION)
+    store.create(job)
+    return job_id
+
+
+def get_job(job_id):
+    if not _JOB_ID.fullmatch(job_id): return None
+    return get_store().get(job_id)
+
+
+def update_job(job_id, statement=None, **fields):
+    """Atualiza campos do job e, com statement=(índice, status), o status de um extrato."""
+    def mutate(job):
+        job.update(fields)
+        if statement is not None:
+            index, status = statement
+            job['statements'][index]['status'] = status
+        job['updated_at'] = time.time()
+        job['version'] += 1
+
+    get_store().update(job_id, mutate)
+    with _changed:
+        _changed.notify_all()
+
+
+def wait_for_update(job_id, version, timeout=15):
+    """
+    Bloqueia até o job passar da versão informada (ou até o timeout). Retorna a cópia atual.
+    Mudanças feitas neste processo acordam na hora; as de outros processos são vistas a cada
+    JOB_POLL_INTERVAL.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        job = get_job(job_id)
+        remaining = deadline - time.monotonic()
+        if job is None or job['version'] != version or remaining <= 0: return job
+        with _changed:
+            _changed.wait(min(remaining, JOB_POLL_INTERVAL))
+
+
+def submit(job_id, fn, *args):
+    """Roda fn(job_id, *args) em segundo plano; exceções viram status 'error' no job."""
+    def run():
+        update_job(job_id, status='running', stage='Iniciando')
+        try:
+            fn(job_id, *args)
+        except Exception as e:
+            log.exception(f"Job {job_id} falhou: {e}")
+            update_job(job_id, status='error', stage='Falhou', error=str(e))
+
+    # Leva o contexto da requisição (id e campos de log) para a thread do job
+    _executor.submit(contextvars.copy_context().run, run)
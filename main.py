@@ -1,6 +1,15 @@
 import pymupdf
 import os
 import re
+import csv
+import json
+import time
+import hashlib
+import argparse
+import statistics
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import bank_profiles
 
 def normalize_value(value_str):
     """
@@ -11,7 +20,7 @@ def normalize_value(value_str):
         return None
     
     # Remove caracteres monetários, espaços, e letras que podem acompanhar os números
-    cleaned_str = value_str.strip().replace("R$", "").replace("C", "").replace("D", "").strip()
+    cleaned_str = value_str.strip().upper().replace("R$", "").replace("C", "").replace("D", "").strip()
 
     # Se o valor já está no formato correto (contém vírgula e ponto), retorna
     if ',' in cleaned_str and '.' in cleaned_str:
@@ -30,122 +39,87 @@ def normalize_value(value_str):
 
     return cleaned_str
 
-def extract_values_from_pdf(file_path):
+def value_to_cents(value_str):
+    """
+    Converte um valor monetário em centavos (int), para comparar valores escritos de formas
+    diferentes: '1.234,56', 'R$ 1.234,56', '1234,56', '1.234,56C' e o '1.234.56' do OCR viram 123456.
+    Retorna None se o texto não terminar com duas casas decimais (datas, CNPJs, percentuais, contas).
+    O sinal é ignorado: '-1.234,56' e '(1.234,56)' valem o mesmo que '1.234,56'.
+    """
+    normalized = normalize_value(value_str)
+    if not normalized: return None
+    normalized = normalized.replace(' ', '').strip('()-')
+    if not re.fullmatch(r'\d[\d.,]*[.,]\d{2}', normalized):
+        return None
+    return int(re.sub(r'[^\d]', '', normalized))
+
+def iter_page_texts(doc):
+    """Texto de cada página, uma por vez (nada do documento fica acumulado)."""
+    for page in doc:
+        yield page.get_text("text", sort=True)
+
+def extract_values_from_pdf(file_path, raise_errors=False):
     """
     Extrai valores de um extrato usando a lógica validada do app_smiconsult.py,
     adaptada para retornar uma lista de valores a serem marcados.
+    Um erro ao ler o PDF é impresso e vira lista vazia, ou é propagado com raise_errors.
+    As páginas são lidas uma a uma; os padrões rodam sobre a página atual junto com a anterior,
+    para que um valor cujo rótulo ficou no fim da página de cima ainda seja encontrado. O texto
+    das páginas lidas antes de o banco aparecer fica guardado e é varrido assim que ele aparece.
     """
     try:
-        doc = pymupdf.open(file_path)
-        full_text_unsplit = ""
-        for page in doc:
-            full_text_unsplit += page.get_text("text", sort=True)
-        
-        text_list = full_text_unsplit.replace('\n', ' ').split()
-        doc.close()
+        # Valores de seções do banco (ex.: 'Resumo do mês' do BB) e do texto todo: se o extrato
+        # tem seções, só os delas valem
+        in_sections, everywhere = set(), set()
+        found_sections = False
+        profile = None
+        undetected = []  # páginas anteriores à primeira que identifica o banco
+        previous_text = ""
+        with pymupdf.open(file_path) as doc:
+            for text in iter_page_texts(doc):
+                if profile is None:
+                    profile = bank_profiles.detect(text, 'main')
+                    undetected.append(text)
+                    if profile is None: continue
+                    texts, undetected = undetected, []
+                else:
+                    texts = [text]
+                for page_text in texts:
+                    values, from_sections = extract_values_from_text(profile, previous_text + "\n" + page_text)
+                    (in_sections if from_sections else everywhere).update(values)
+                    found_sections = found_sections or from_sections
+                    previous_text = page_text
 
-        extracted = []
-        full_text_lower = full_text_unsplit.lower()
-
-        # --- Lógica para XP ---
-        if 'xp' in full_text_lower or 'xp investimentos' in full_text_lower:
-            # Padrão para Títulos Públicos (saldo anterior e atual na mesma linha)
-            padrao_tp = r'(\d{1,3}(?:\.\d{3})*,\d{2})\s+(\d{1,3}(?:\.\d{3})*,\d{2})\s+\d{1,3}(?:\.\d{3})*,\d+'
-            matches_tp = re.findall(padrao_tp, full_text_unsplit)
-            for match in matches_tp:
-                extracted.append(normalize_value(match[0])) # Saldo Anterior
-                extracted.append(normalize_value(match[1])) # Saldo Atual
-            
-            # Padrões para outros valores em extratos XP
-            patterns_xp = [
-                r"Saldo bruto atual:\s*R\$\s*([\d.,]+)",
-                r"Total aplicado:\s*R\$\s*([\d.,]+)",
-                r"Total resgatado:\s*R\$\s*([\d.,]+)",
-                r"SALDO FINAL\s+[\d,.]+\s+([\d.,]+)",
-                r"Rendimento Bruto\s+([\d.,]+)"
-            ]
-            for pattern in patterns_xp:
-                 matches = re.findall(pattern, full_text_unsplit.replace("\n", " "))
-                 for m in matches:
-                     if m != "00,00": extracted.append(normalize_value(m))
-
-
-        # --- Lógica para BANCO DO BRASIL ---
-        elif 'banco do brasil' in full_text_lower or 'bb previd' in full_text_lower:
-            resumo_sections = re.findall(r"Resumo do m[êe]s\s+(.*?)(?=Resumo do m[êe]s|Transação efetuada com sucesso)", full_text_unsplit, re.DOTALL)
-            if not resumo_sections: resumo_sections = [full_text_unsplit]
-
-            for section in resumo_sections:
-                patterns = {
-                    'saldo_atual': r"SALDO ATUAL\s*=\s*([\d.,]+)",
-                    'aplicacoes': r"APLICAÇÕES\s*\(\+\)\s*([\d.,]+)",
-                    'resgates': r"RESGATES\s*\(\-\)\s*([\d.,]+)",
-                    'rendimento': r"RENDIMENTO BRUTO\s*\(\+\)\s*([\d.,]+)"
-                }
-                for key, pattern in patterns.items():
-                    match = re.search(pattern, section.replace("\n", " "))
-                    if match and match.group(1) != '0,00':
-                        extracted.append(normalize_value(match.group(1)))
-
-        # --- Lógica para CAIXA (CEF) ---
-        elif 'caixa' in full_text_lower or 'cef' in full_text_lower:
-            patterns = [
-                r"Aplicações\s+([\d.,]+C?)",
-                r"Resgates\s+([\d.,]+D?)",
-                r"Saldo Bruto\*\s+([\d.,]+C?)",
-                r"Rendimento Bruto no Mês\s+([\d.,]+C?)",
-                r"Rendimento Bruto\s+R\$\s*([\d.,]+)",
-                r"Saldo Bruto Final\s+R\$\s*([\d.,]+)"
-            ]
-            for pattern in patterns:
-                matches = re.findall(pattern, full_text_unsplit.replace("\n", " "))
-                for match in matches:
-                    if match and match != '0,00':
-                        extracted.append(normalize_value(match))
-
-        # --- Lógica para BRADESCO ---
-        elif 'bradesco' in full_text_lower:
-            patterns = [
-                r"Saldo em\s+\d{2}/\d{2}/\d{4}\s+([\d.,]+)",
-                r"Saldo Final\s+[\d.,]+\s+[\d,.]+\s+([\d.,]+)",
-                r"Rendimento\s+Bruto\s+([\d.,]+)",
-                r"Aplicações no Período\s+([\d.,]+)",
-                r"Resgates no Período\s+[\d,.]+\s+([\d.,]+)"
-            ]
-            for pattern in patterns:
-                matches = re.findall(pattern, full_text_unsplit.replace("\n", " "))
-                for match in matches:
-                    if match and match not in ['0.00', '0,00']:
-                        extracted.append(normalize_value(match))
-        
-        # --- Lógica para ITAÚ ---
-        elif 'itaú' in full_text_lower:
-            patterns = [
-                r"SALDO BRUTO ATUAL\s+[\d,.]+\s+([\d.,]+)",
-                r"APLICACOES\s+([\d.,]+)",
-                r"RESGATES\s+([\d.,]+)",
-                r"RENDIMENTO BRUTO NO MES\s+([\d.,]+)"
-            ]
-            for pattern in patterns:
-                 matches = re.findall(pattern, full_text_unsplit.replace("\n", " "))
-                 for match in matches:
-                    if match and match != '0,00':
-                        extracted.append(normalize_value(match))
-
-        return list(set([v for v in extracted if v]))
+        extracted = in_sections if found_sections else everywhere
+        return list(v for v in extracted if v)
     
     except Exception as e:
+        if raise_errors: raise
         print(f"Erro ao processar o arquivo {os.path.basename(file_path)}: {e}")
         return []
 
+def extract_values_from_text(profile, text):
+    """
+    Valores de um trecho do extrato (até duas páginas) pelos padrões do banco em bank_profiles.
+    Retorna (valores, se vieram das seções do banco).
+    """
+    page_text = bank_profiles.normalize_page(text, 'main')
+    values = bank_profiles.scan_sections(profile, page_text, 'main')
+    if values is not None:
+        return [normalize_value(v) for v in values], True
+    return [normalize_value(v) for v in bank_profiles.scan_values(profile, page_text, 'main')], False
+
 
-def highlight_pdf(input_pdf, output_pdf, values_to_find):
+def highlight_pdf(input_pdf, output_pdf, values_to_find, verbose=True, raise_errors=False):
     """
     Abre um PDF e destaca todas as ocorrências dos valores financeiros fornecidos.
+    Retorna os valores que foram encontrados (e marcados) pelo menos uma vez.
+    Um erro ao abrir ou gravar o PDF é impresso e vira lista vazia, ou é propagado com raise_errors.
     """
+    matched = set()
     try:
         doc = pymupdf.open(input_pdf)
-        print(f"\nIniciando marcação no arquivo '{input_pdf}'...")
+        if verbose: print(f"\nIniciando marcação no arquivo '{input_pdf}'...")
         total_highlights = 0
         for page in doc:
             for value in values_to_find:
@@ -158,26 +132,218 @@ def highlight_pdf(input_pdf, output_pdf, values_to_find):
                     for rect in areas:
                         page.add_highlight_annot(rect)
                         total_highlights += 1
-                    print(f"  -> Valor '{value}' marcado na página {page.number + 1}.")
+                    matched.add(value)
+                    if verbose: print(f"  -> Valor '{value}' marcado na página {page.number + 1}.")
         
         if total_highlights > 0:
             doc.save(output_pdf)
-            print(f"\nSucesso! {total_highlights} marcações foram feitas.")
-            print(f"Arquivo final salvo como '{output_pdf}'.")
-        else:
+            if verbose:
+                print(f"\nSucesso! {total_highlights} marcações foram feitas.")
+                print(f"Arquivo final salvo como '{output_pdf}'.")
+        elif verbose:
             print("\nNenhum valor encontrado para marcar no arquivo de apuração.")
         
         doc.close()
+        return [v for v in values_to_find if v in matched]
     except Exception as e:
+        if raise_errors: raise
         print(f"Erro ao tentar marcar o PDF '{input_pdf}': {e}")
+        return []
 
 
-# --- Bloco Principal de Execução ---
-if __name__ == "__main__":
-    input_folder = "arquivos"
-    target_pdf = "Apuração.pdf"
-    output_pdf = "Apuracao_marcada.pdf"
+# --- Lote: vários clientes em paralelo ---
+# Cada conjunto é um cliente: uma apuração e os seus extratos. Os conjuntos rodam num pool de
+# processos; cada um que termina vai para o checkpoint (uma linha JSON), então uma execução
+# interrompida retoma só os que faltam. No fim sai um relatório consolidado (CSV com um valor
+# por linha e JSON com o resumo por cliente e a vazão).
+BATCH_OUTPUT_NAME = "Apuracao_marcada.pdf"
+
+
+def _is_apuracao(filename):
+    name = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode().lower()
+    return name.startswith('apura') and name.endswith('.pdf')
+
+
+def _list_pdfs(folder):
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith('.pdf'))
+
+
+def discover_sets(root):
+    """
+    Conjuntos de uma pasta raiz: cada subpasta é um cliente, com a apuração (arquivo que começa
+    por 'Apuração') e os extratos em 'arquivos/' (como no modo de uma pasta só) ou ao lado dela.
+    """
+    sets = []
+    for cliente in sorted(os.listdir(root)):
+        folder = os.path.join(root, cliente)
+        if not os.path.isdir(folder): continue
+        apuracoes = [p for p in _list_pdfs(folder) if _is_apuracao(os.path.basename(p))]
+        if not apuracoes:
+            print(f"Aviso: '{cliente}' ignorado, sem arquivo de apuração.")
+            continue
+        statements_folder = os.path.join(folder, "arquivos")
+        if os.path.isdir(statements_folder):
+            extratos = _list_pdfs(statements_folder)
+        else:
+            extratos = [p for p in _list_pdfs(folder) if p not in apuracoes]
+        sets.append({'cliente': cliente, 'apuracao': apuracoes[0], 'extratos': extratos})
+    return sets
+
+
+def load_manifest(path):
+    """
+    Conjuntos de um manifesto JSON: [{"cliente": ..., "apuracao": ..., "extratos": [...]}].
+    Caminhos relativos partem da pasta do manifesto.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    resolve = lambda p: p if os.path.isabs(p) else os.path.join(base, p)
+    return [{'cliente': str(entry['cliente']), 'apuracao': resolve(entry['apuracao']),
+             'extratos': [resolve(p) for p in entry['extratos']]} for entry in entries]
 
+
+def set_fingerprint(audit_set):
+    """Identifica o conteúdo de um conjunto (caminhos, tamanhos e datas): se mudar, o cliente roda de novo."""
+    digest = hashlib.sha256()
+    for path in [audit_set['apuracao']] + sorted(audit_set['extratos']):
+        st = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def process_set(audit_set, output_dir):
+    """
+    Extrai os extratos e marca a apuração de um cliente (roda num processo do pool). Um PDF que
+    não abre interrompe o cliente com a exceção: ele sai como erro e não entra no checkpoint.
+    """
+    started = time.perf_counter()
+    per_statement = {}
+    for path in audit_set['extratos']:
+        per_statement[os.path.basename(path)] = extract_values_from_pdf(path, raise_errors=True)
+
+    unique_values = sorted(set(v for values in per_statement.values() for v in values if v))
+    output_pdf = os.path.join(output_dir, re.sub(r'[\\/]', '_', audit_set['cliente']), BATCH_OUTPUT_NAME)
+    os.makedirs(os.path.dirname(output_pdf), exist_ok=True)
+    # A apuração é aberta mesmo sem valores, para que um arquivo corrompido apareça como erro
+    matched = set(highlight_pdf(audit_set['apuracao'], output_pdf, unique_values, verbose=False, raise_errors=True))
+
+    return {
+        'cliente': audit_set['cliente'],
+        'status': 'ok',
+        'apuracao': audit_set['apuracao'],
+        'saida': output_pdf if matched else None,
+        'extratos': {name: {'marcados': [v for v in values if v in matched],
+                            'nao_encontrados': [v for v in values if v not in matched]}
+                     for name, values in per_statement.items()},
+        'valores': len(unique_values),
+        'marcados': len(matched),
+        'bytes': sum(os.path.getsize(p) for p in [audit_set['apuracao']] + audit_set['extratos']),
+        'segundos': round(time.perf_counter() - started, 3),
+    }
+
+
+def load_checkpoint(path):
+    """Resultados já concluídos: {cliente: resultado}. Uma linha truncada (interrupção na escrita) é ignorada."""
+    done = {}
+    if not os.path.exists(path): return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            done[entry['cliente']] = entry
+    return done
+
+
+def _append_checkpoint(f, result):
+    f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def write_reports(results, output_dir, stats):
+    """relatorio.csv (um valor por linha) e relatorio.json (resumo por cliente e vazão)."""
+    csv_path = os.path.join(output_dir, "relatorio.csv")
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['cliente', 'extrato', 'valor', 'situacao'])
+        for result in results:
+            if result['status'] != 'ok':
+                writer.writerow([result['cliente'], '', '', f"erro: {result['erro']}"])
+                continue
+            for name, values in result['extratos'].items():
+                for v in values['marcados']: writer.writerow([result['cliente'], name, v, 'marcado'])
+                for v in values['nao_encontrados']: writer.writerow([result['cliente'], name, v, 'nao encontrado'])
+
+    json_path = os.path.join(output_dir, "relatorio.json")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({'vazao': stats, 'clientes': results}, f, ensure_ascii=False, indent=2)
+    return csv_path, json_path
+
+
+def run_batch(sets, output_dir, workers=None, checkpoint_path=None):
+    """Processa os conjuntos no pool, retomando do checkpoint. Retorna (resultados, estatísticas)."""
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint_path = checkpoint_path or os.path.join(output_dir, "checkpoint.jsonl")
+    done = load_checkpoint(checkpoint_path)
+
+    pending, results = [], {}
+    for audit_set in sets:
+        fingerprint = set_fingerprint(audit_set)
+        previous = done.get(audit_set['cliente'])
+        if previous and previous.get('fingerprint') == fingerprint:
+            results[audit_set['cliente']] = previous
+        else:
+            pending.append((audit_set, fingerprint))
+    print(f"{len(sets)} clientes: {len(results)} já concluídos no checkpoint, {len(pending)} a processar.")
+
+    started = time.perf_counter()
+    processed = []
+    with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint, \
+            ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        futures = {pool.submit(process_set, audit_set, output_dir): (audit_set, fingerprint)
+                   for audit_set, fingerprint in pending}
+        try:
+            for future in as_completed(futures):
+                audit_set, fingerprint = futures[future]
+                try:
+                    result = future.result()
+                    result['fingerprint'] = fingerprint
+                    # Só os concluídos entram no checkpoint; os que falharam rodam de novo na retomada
+                    _append_checkpoint(checkpoint, result)
+                    print(f"[{len(processed) + 1}/{len(pending)}] {result['cliente']}: "
+                          f"{result['marcados']}/{result['valores']} valores marcados ({result['segundos']}s)")
+                except Exception as e:
+                    result = {'cliente': audit_set['cliente'], 'status': 'erro', 'erro': str(e),
+                              'apuracao': audit_set['apuracao']}
+                    print(f"[{len(processed) + 1}/{len(pending)}] {audit_set['cliente']}: erro: {e}")
+                results[audit_set['cliente']] = result
+                processed.append(result)
+        except KeyboardInterrupt:
+            for future in futures: future.cancel()
+            print("\nInterrompido: os clientes concluídos estão no checkpoint; rode de novo para retomar.")
+            raise
+    elapsed = time.perf_counter() - started
+
+    ok = [r for r in processed if r['status'] == 'ok']
+    stats = {
+        'clientes': len(sets),
+        'processados': len(processed),
+        'retomados': len(sets) - len(pending),
+        'erros': len(processed) - len(ok),
+        'segundos': round(elapsed, 3),
+        'clientes_por_minuto': round(len(processed) / elapsed * 60, 2) if elapsed else None,
+        'extratos_por_segundo': round(sum(len(r['extratos']) for r in ok) / elapsed, 2) if elapsed else None,
+        'mb_por_segundo': round(sum(r['bytes'] for r in ok) / 1e6 / elapsed, 2) if elapsed else None,
+        'mediana_segundos_por_cliente': statistics.median(r['segundos'] for r in ok) if ok else None,
+    }
+    return [results[s['cliente']] for s in sets if s['cliente'] in results], stats
+
+
+def run_single(input_folder, target_pdf, output_pdf):
+    """Uma pasta de extratos e uma apuração, em série (o modo original)."""
     if not os.path.isdir(input_folder):
         print(f"Erro: A pasta '{input_folder}' não foi encontrada.")
     elif not os.path.exists(target_pdf):
@@ -208,4 +374,28 @@ if __name__ == "__main__":
             # Inicia a fase de marcação no PDF de apuração
             highlight_pdf(target_pdf, output_pdf, unique_values)
         else:
-            print("\nNenhum valor foi extraído dos arquivos na pasta 'arquivos'.")
\ No newline at end of file
+            print("\nNenhum valor foi extraído dos arquivos na pasta 'arquivos'.")
+
+
+# --- Bloco Principal de Execução ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Marca na apuração os valores dos extratos. Sem argumentos, usa a pasta 'arquivos' "
+                    "e 'Apuração.pdf'; com --raiz ou --manifesto, processa vários clientes em paralelo.")
+    parser.add_argument('--raiz', help="pasta com uma subpasta por cliente")
+    parser.add_argument('--manifesto', help="JSON com os conjuntos (cliente, apuracao, extratos)")
+    parser.add_argument('--saida', default="saida_lote", help="pasta das apurações marcadas e dos relatórios")
+    parser.add_argument('--workers', type=int, default=None, help="processos em paralelo (padrão: núcleos)")
+    parser.add_argument('--checkpoint', default=None, help="arquivo de checkpoint (padrão: SAIDA/checkpoint.jsonl)")
+    args = parser.parse_args()
+
+    if not args.raiz and not args.manifesto:
+        run_single("arquivos", "Apuração.pdf", "Apuracao_marcada.pdf")
+    else:
+        sets = load_manifest(args.manifesto) if args.manifesto else discover_sets(args.raiz)
+        results, stats = run_batch(sets, args.saida, args.workers, args.checkpoint)
+        csv_path, json_path = write_reports(results, args.saida, stats)
+        print(f"\n{stats['processados']} clientes processados em {stats['segundos']}s "
+              f"({stats['clientes_por_minuto']} clientes/min, {stats['extratos_por_segundo']} extratos/s); "
+              f"{stats['retomados']} retomados do checkpoint, {stats['erros']} com erro.")
+        print(f"Relatórios: '{csv_path}' e '{json_path}'.")
@@ -0,0 +1,98 @@
+import os
+import logging
+import threading
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:  # dependência opcional: sem ela o OCR usa o pytesseract (um processo por chamada)
+    tesserocr = None
+
+# Backend de OCR: 'tesserocr' mantém uma instância da libtesseract carregada por thread com o
+# modelo 'por' e recebe as imagens direto da memória; 'pytesseract' dispara o executável
+# tesseract e grava arquivos temporários a cada chamada. 'auto' usa o tesserocr se instalado.
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'auto')
+OCR_LANG = 'por'
+PYTESSERACT_CONFIG = r'--oem 3 --psm 6'
+
+_local = threading.local()
+
+log = logging.getLogger('corretor.ocr')
+
+
+def active_backend():
+    if OCR_BACKEND == 'pytesseract' or tesserocr is None: return 'pytesseract'
+    if getattr(_local, 'failed', False): return 'pytesseract'
+    return 'tesserocr'
+
+
+def _engines():
+    """Instâncias da thread atual (criadas na primeira chamada e reaproveitadas depois)."""
+    if not hasattr(_local, 'text_api'):
+        try:
+            _local.text_api = tesserocr.PyTessBaseAPI(lang=OCR_LANG, psm=tesserocr.PSM.SINGLE_BLOCK,
+                                                      oem=tesserocr.OEM.DEFAULT)
+            _local.osd_api = tesserocr.PyTessBaseAPI(lang='osd', psm=tesserocr.PSM.OSD_ONLY)
+        except Exception as e:
+            log.warning(f"tesserocr indisponível nesta thread ({e}); usando pytesseract")
+            _local.failed = True
+            return None
+    return _local.text_api, _local.osd_api
+
+
+# --- pytesseract (fallback) ---
+def _pytesseract_recognize(img):
+    data = pytesseract.image_to_data(img, lang=OCR_LANG, config=PYTESSERACT_CONFIG,
+                                     output_type=pytesseract.Output.DICT)
+    confidences = [float(c) for c, w in zip(data['conf'], data['text']) if w.strip() and float(c) >= 0]
+    confidence = sum(confidences) / len(confidences) if confidences else 0
+
+    # Remonta o texto linha a linha (bloco, parágrafo, linha)
+    lines = {}
+    for i, word in enumerate(data['text']):
+        if not word.strip(): continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append(word)
+    return '\n'.join(' '.join(words) for words in lines.values()), confidence
+
+
+def _pytesseract_orientation(img):
+    try:
+        result = pytesseract.image_to_osd(img, config=r'--psm 0')
+        for line in result.split('\n'):
+            if 'Rotate' in line: return int(line.split(':')[1].strip())
+    except Exception:
+        return 0
+    return 0
+
+
+# --- API ---
+def recognize(img):
+    """Retorna (texto, confiança média 0-100) da imagem PIL."""
+    engines = _engines() if active_backend() == 'tesserocr' else None
+    if engines is None: return _pytesseract_recognize(img)
+
+    api = engines[0]
+    api.SetImage(img)
+    text = api.GetUTF8Text()
+    confidence = api.MeanTextConf()
+    api.Clear()
+    return text, confidence
+
+
+def detect_orientation(img):
+    """Graus que a imagem precisa girar para o texto ficar em pé (mesmo 'Rotate' do image_to_osd)."""
+    engines = _engines() if active_backend() == 'tesserocr' else None
+    if engines is None: return _pytesseract_orientation(img)
+
+    api = engines[1]
+    try:
+        api.SetImage(img)
+        result = api.DetectOrientationScript()
+    except Exception:
+        return 0
+    finally:
+        api.Clear()
+    if not result: return 0
+    # O tesserocr informa a orientação atual do texto; o giro de correção é o complemento
+    return (360 - result['orient_deg']) % 360
@@ -0,0 +1,208 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import cProfile
+import logging
+import threading
+import contextlib
+import contextvars
+
+# Telemetria do corretor: cronômetros por etapa, contadores, logs JSON com o id da requisição
+# e exposição no formato do Prometheus (/metrics).
+#
+# Nos processos do pool de extração as medições e os logs são coletados (capture) e devolvidos
+# junto com o resultado; o processo pai repete tudo (replay) no seu registro e no seu log, assim
+# as métricas ficam num lugar só e o log de cada arquivo sai agrupado e com o id certo.
+
+# Limites (s) dos buckets do histograma de duração das etapas
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_request_id = contextvars.ContextVar('request_id', default='-')
+# Formato aceito para o X-Request-ID vindo do cliente: o id entra em logs e no nome do arquivo de perfil
+_REQUEST_ID = re.compile(r'[A-Za-z0-9_-]{1,64}')
+_request_stats = contextvars.ContextVar('request_stats', default=None)
+_fields = contextvars.ContextVar('log_fields', default={})
+_collector = contextvars.ContextVar('collector', default=None)
+
+_lock = threading.Lock()
+_stages = {}    # etapa -> {'count', 'sum', 'buckets': [...]}
+_counters = {}  # nome -> total
+
+log = logging.getLogger('corretor')
+
+
+# --- LOGS ---
+class JsonLogHandler(logging.StreamHandler):
+    """Escreve um objeto JSON por linha; dentro de capture() guarda o registro em vez de escrever."""
+
+    def emit(self, record):
+        collector = _collector.get()
+        if collector is not None:
+            fields = dict(_fields.get())
+            fields.update(getattr(record, 'campos', {}))
+            collector['logs'].append((record.name, record.levelno, record.getMessage(), fields))
+            return
+        super().emit(record)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': _request_id.get(),
+            'msg': record.getMessage(),
+        }
+        entry.update(_fields.get())
+        entry.update(getattr(record, 'campos', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level=None):
+    root = logging.getLogger('corretor')
+    if any(isinstance(h, JsonLogHandler) for h in root.handlers): return
+    handler = JsonLogHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    root.addHandler(handler)
+    root.setLevel(level or os.environ.get('LOG_LEVEL', 'INFO'))
+    root.propagate = False
+
+
+@contextlib.contextmanager
+def bind(**fields):
+    """Acrescenta campos fixos (ex.: arquivo) a todos os logs emitidos dentro do bloco."""
+    token = _fields.set({**_fields.get(), **fields})
+    try:
+        yield
+    finally:
+        _fields.reset(token)
+
+
+# --- REQUISIÇÃO ---
+def start_request(request_id=None):
+    """Começa as estatísticas de uma requisição. Um id recebido fora de _REQUEST_ID é trocado por um novo."""
+    if not request_id or not _REQUEST_ID.fullmatch(request_id):
+        request_id = uuid.uuid4().hex
+    _request_id.set(request_id)
+    _request_stats.set({'stages': {}, 'counters': {}})
+    return request_id
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def request_summary():
+    """Tempo total (ms) por etapa e contadores acumulados na requisição atual."""
+    stats = _request_stats.get() or {'stages': {}, 'counters': {}}
+    return {
+        'stages_ms': {name: round(total * 1000, 1) for name, total in stats['stages'].items()},
+        'counters': dict(stats['counters']),
+    }
+
+
+# --- MEDIÇÕES ---
+def _record_stage(name, seconds):
+    collector = _collector.get()
+    if collector is not None:
+        collector['stages'].append((name, seconds))
+        return
+    with _lock:
+        entry = _stages.setdefault(name, {'count': 0, 'sum': 0.0, 'buckets': [0] * len(STAGE_BUCKETS)})
+        entry['count'] += 1
+        entry['sum'] += seconds
+        for i, limit in enumerate(STAGE_BUCKETS):
+            if seconds <= limit: entry['buckets'][i] += 1
+        stats = _request_stats.get()
+        if stats is not None:
+            stats['stages'][name] = stats['stages'].get(name, 0.0) + seconds
+
+
+def incr(name, amount=1):
+    collector = _collector.get()
+    if collector is not None:
+        collector['counters'].append((name, amount))
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+        stats = _request_stats.get()
+        if stats is not None:
+            stats['counters'][name] = stats['counters'].get(name, 0) + amount
+
+
+@contextlib.contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_stage(name, time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def capture():
+    """Coleta medições e logs do bloco (em um processo filho) num dict serializável."""
+    collected = {'stages': [], 'counters': [], 'logs': []}
+    token = _collector.set(collected)
+    try:
+        yield collected
+    finally:
+        _collector.reset(token)
+
+
+def replay(collected):
+    """Registra no processo atual o que foi coletado por capture() em outro processo."""
+    if not collected: return
+    for name, seconds in collected['stages']:
+        _record_stage(name, seconds)
+    for name, amount in collected['counters']:
+        incr(name, amount)
+    for logger_name, level, message, fields in collected['logs']:
+        logging.getLogger(logger_name).log(level, message, extra={'campos': fields})
+
+
+# --- PROMETHEUS ---
+def render_prometheus():
+    with _lock:
+        stages = {name: dict(entry, buckets=list(entry['buckets'])) for name, entry in _stages.items()}
+        counters = dict(_counters)
+
+    lines = ['# HELP corretor_stage_seconds Duração das etapas do pipeline de auditoria.',
+             '# TYPE corretor_stage_seconds histogram']
+    for name in sorted(stages):
+        entry = stages[name]
+        for limit, count in zip(STAGE_BUCKETS, entry['buckets']):
+            lines.append(f'corretor_stage_seconds_bucket{{stage="{name}",le="{limit}"}} {count}')
+        lines.append(f'corretor_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {entry["count"]}')
+        lines.append(f'corretor_stage_seconds_sum{{stage="{name}"}} {entry["sum"]:.6f}')
+        lines.append(f'corretor_stage_seconds_count{{stage="{name}"}} {entry["count"]}')
+
+    lines += ['# HELP corretor_events_total Contadores de eventos do pipeline (páginas, valores, cache...).',
+              '# TYPE corretor_events_total counter']
+    for name in sorted(counters):
+        lines.append(f'corretor_events_total{{event="{name}"}} {counters[name]}')
+    return '\n'.join(lines) + '\n'
+
+
+# --- PERFIL ---
+@contextlib.contextmanager
+def profiled(enabled, output_path):
+    """Roda o bloco sob cProfile e grava o .prof em output_path (só a thread atual é perfilada)."""
+    if not enabled:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        profiler.dump_stats(output_path)
+        log.info("Perfil cProfile gravado", extra={'campos': {'arquivo_perfil': output_path}})
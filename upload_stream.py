@@ -0,0 +1,111 @@
+import os
+import hashlib
+import logging
+import pymupdf
+from werkzeug.utils import secure_filename
+from werkzeug.sansio.multipart import MultipartDecoder, File, Field, Data, Epilogue, NeedData
+import blob_store
+import extraction_cache
+
+# Leitura incremental do corpo multipart: cada arquivo é entregue assim que a sua parte termina
+# de chegar, sem esperar o resto do envio, e fica em memória. Só os maiores que UPLOAD_SPILL_BYTES
+# vão para o disco, escritos aos poucos enquanto chegam, e terminam no armazenamento por conteúdo
+# (blob_store.py): o mesmo arquivo enviado várias vezes ocupa o disco uma vez só.
+#
+# Um arquivo recebido ("fonte") é (nome, bytes) quando ficou em memória ou (nome, caminho) quando
+# foi para o armazenamento. Um caminho (str) sozinho também vale (benchmarks, CLI).
+
+# Acima deste tamanho (bytes) um arquivo enviado é gravado em disco em vez de ficar em memória
+UPLOAD_SPILL_BYTES = int(os.environ.get('UPLOAD_SPILL_BYTES', 32 * 1024 * 1024))
+# Tamanho dos blocos lidos do corpo da requisição
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+log = logging.getLogger('corretor.upload')
+
+
+class _Part:
+    def __init__(self, field, filename):
+        self.field = field
+        self.filename = filename
+        self.buffer = bytearray()
+        self.file = None
+        self.digest = None
+
+    def write(self, data):
+        if self.file is None and len(self.buffer) + len(data) > UPLOAD_SPILL_BYTES:
+            self.spill_path = blob_store.temp_path('.pdf')
+            self.file = open(self.spill_path, 'wb')
+            self.file.write(self.buffer)
+            # O hash é calculado enquanto chega, para não reler o arquivo ao guardá-lo
+            self.digest = hashlib.sha256(self.buffer)
+            self.buffer = None
+            log.info(f"{self.filename} passou de {UPLOAD_SPILL_BYTES} bytes; gravando em disco")
+        if self.file is not None:
+            self.file.write(data)
+            self.digest.update(data)
+        else:
+            self.buffer += data
+
+    def finish(self):
+        if self.file is not None:
+            self.file.close()
+            content_hash = blob_store.put_file(self.spill_path, 'upload', self.digest.hexdigest())
+            return self.filename, blob_store.object_path(content_hash)
+        return self.filename, bytes(self.buffer)
+
+
+def iter_uploads(stream, boundary):
+    """
+    Lê o corpo multipart de `stream` e gera (campo, fonte) para cada arquivo, na ordem em que
+    terminam de chegar. Campos sem arquivo são ignorados. Nomes repetidos no mesmo envio ganham
+    um prefixo (a dica de conta vem do fim do nome).
+    """
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    used = set()
+    part = None
+    count = 0
+    finished = False
+    while not finished:
+        chunk = stream.read(UPLOAD_CHUNK_BYTES)
+        decoder.receive_data(chunk or None)
+        finished = not chunk
+        while True:
+            event = decoder.next_event()
+            if isinstance(event, NeedData): break
+            if isinstance(event, File):
+                count += 1
+                name = secure_filename(event.filename or '')
+                if not name:
+                    part = None  # input de arquivo enviado vazio
+                    continue
+                if name in used: name = f"{count}_{name}"
+                used.add(name)
+                part = _Part(event.name, name)
+            elif isinstance(event, Field):
+                part = None
+            elif isinstance(event, Data) and part is not None:
+                part.write(event.data)
+                if not event.more_data:
+                    yield part.field, part.finish()
+                    part = None
+            elif isinstance(event, Epilogue):
+                finished = True
+                break
+
+
+# --- FONTES ---
+def source_name(source):
+    return os.path.basename(source) if isinstance(source, str) else source[0]
+
+
+def source_sha256(source):
+    if isinstance(source, str): return extraction_cache.file_sha256(source)
+    # No armazenamento o nome do arquivo já é o hash do conteúdo
+    if isinstance(source[1], str): return os.path.basename(source[1])
+    return hashlib.sha256(source[1]).hexdigest()
+
+
+def open_pdf(source):
+    if isinstance(source, str): return pymupdf.open(source)
+    if isinstance(source[1], str): return pymupdf.open(source[1])
+    return pymupdf.open(stream=source[1], filetype='pdf')